@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends, Query
+
+from config import Config
+from schemas import Principal
+from authentication.authentication_handler import get_current_superuser
+from utils.query_log import slow_query_log
+
+
+admin = APIRouter(prefix=Config.ADMIN_PREFIX)
+
+
+@admin.get('/getSlowQueries/', tags=['Admin'])
+async def get_slow_queries(
+    n: int = Query(Config.DEFAULT_SLOW_QUERIES, ge=1, le=Config.MAX_SLOW_QUERIES),
+    current_user: Principal = Depends(get_current_superuser),
+) -> list[dict]:
+    """[SUPERUSER-ONLY] Get the `n` slowest statement fingerprints seen by this worker, with their slowest sample and plan."""
+    return slow_query_log.top(n)
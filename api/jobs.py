@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends
+
+from config import Config, error_message
+from schemas import JobView, Principal
+from authentication.authentication_handler import get_current_user
+from utils.jobs import Job, jobs as job_registry
+
+
+jobs = APIRouter(prefix=Config.JOBS_PREFIX)
+
+
+def check_job_access(job: Job | None, current_user: Principal) -> Job:
+    """function for making sure a job exists and was started by the current user (any job for the superuser)."""
+    if job is None or (job.owner_id != current_user.id and not current_user.is_superuser):
+        raise error_message[404]
+    return job
+
+
+@jobs.get('/getJob/{job_id}', tags=['Job'], response_model=JobView)
+async def get_job(job_id: str, current_user: Principal = Depends(get_current_user)) -> dict:
+    """Get the status and progress of a background job started by the current logged-in user (any job for the superuser)."""
+    job = check_job_access(await job_registry.get(job_id), current_user)
+    return job.view()
+
+
+@jobs.delete('/cancelJob/{job_id}', tags=['Job'], response_model=JobView, status_code=202)
+async def cancel_job(job_id: str, current_user: Principal = Depends(get_current_user)) -> dict:
+    """
+    Cancel a background job started by the current logged-in user (any job for the superuser);
+    a queued job never runs, a running one stops shortly (keeping whatever it already committed).
+    """
+    check_job_access(await job_registry.get(job_id), current_user)
+    job = check_job_access(await job_registry.cancel(job_id), current_user)
+    return job.view()
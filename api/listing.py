@@ -1,117 +1,334 @@
 from datetime import datetime
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import Config, error_message
+from database import get_db, get_read_db, use_primary
 from crud.listing import (
     fetch_all_listings,
     fetch_all_listings_of_user,
+    search_listings,
+    search_addresses,
     fetch_listing_by_id,
     insert_listing,
     update_listing,
     delete_listing,
-    delete_user_listings,
-    delete_all_listings,
+    delete_listings_in_chunks,
+    delete_user_listings_in_chunks,
+)
+from schemas import (
+    ListingAdd,
+    ListingUpdate,
+    ListingView,
+    ListingPage,
+    ListingSort,
+    ExportFormat,
+    ListingExpand,
+    ListingImportReport,
+    JobView,
+    ListingStatsView,
+    Principal,
+    AddressMatch,
+    AddressSuggestion,
+    Listing as ListingType,
+)
+from authentication.authentication_handler import get_current_user, get_current_superuser
+from crud.stats import fetch_listing_stats
+from utils.pagination import decode_cursor
+from utils.address_index import address_index
+from utils.export import export_listings, MEDIA_TYPES
+from utils.importer import import_listings
+from utils.cache import listing_cache
+from utils.single_flight import listing_flight
+from utils.loader import Loaders, get_loaders, expand_listings
+from utils.jobs import jobs, with_session
+from utils.etag import (
+    get_collection_version,
+    collection_etag,
+    listing_etag,
+    etag_matches,
+    etag_headers,
+    not_modified,
 )
-from crud.user import fetch_user_by_id
-from schemas import ListingAdd, ListingUpdate, ListingView
-from authentication.authentication_handler import get_current_user
 
 
 listings = APIRouter(prefix=f'{Config.LISTINGS_PREFIX}')
 
+# the mass deletes run as background jobs
+jobs.register('delete_user_listings', with_session(delete_user_listings_in_chunks))
+jobs.register('delete_all_listings', with_session(delete_listings_in_chunks))
 
-@listings.get('/getListing/{listing_id}', tags=['Listing'], response_model=ListingView | dict[str, str])
-async def get_listing(listing_id: str) -> dict[str, str]:
-    """Get a listing by its id."""
-    response = await fetch_listing_by_id(listing_id)
-    if response:
-        return response
-    raise error_message[400]
+# the listing reads below return their rows already shaped like their `response_model`
+# inside an `ORJSONResponse`, so FastAPI serializes them as they are instead of validating every row again
 
 
-@listings.get('/getUserListings/{user_id}', tags=['Listing'], response_model=list[ListingView] | list[dict[str, str]])
-async def get_user_listings(user_id: str = Depends(get_current_user)) -> list[dict[str, str]]:
-    """Get all the listings registered by the current logged-in user."""
-    response = await fetch_all_listings_of_user(user_id)
-    if response:
-        return response
-    raise error_message[400]
+@listings.get('/getListing/{listing_id}', tags=['Listing'], response_model=ListingView, response_model_exclude_unset=True)
+async def get_listing(
+    listing_id: str,
+    response: Response,
+    expand: list[ListingExpand] = Query([]),
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+    loaders: Loaders = Depends(get_loaders),
+) -> dict:
+    """
+    Get a listing by its id, with its owner embedded when `expand=owner` is given;
+    send back its `ETag` as `If-None-Match` to get an empty `304` while it is unchanged
+    (answered from the cache when possible).
+    """
+    listing = await fetch_listing_by_id(db, listing_id)
+    if 'NoListingsFoundError' in listing:
+        raise error_message[404]
 
+    if expand:
+        # the owner can change while the listing does not, so an expanded listing has no `ETag`
+        [listing] = await expand_listings([listing], expand, loaders)
+        return listing
 
-@listings.get('/getAllListings/', tags=['Listing'], response_model=list[ListingView] | list[dict[str, str]])
-async def get_all_listings() -> list[dict[str, str]]:
-    """Get all the registered listings."""
-    response = await fetch_all_listings()
-    if response:
-        return response
-    raise error_message[400]
+    etag = listing_etag(listing)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+    return listing
+
+
+@listings.get('/getUserListings/{user_id}', tags=['Listing'], response_model=ListingPage)
+async def get_user_listings(
+    cursor: str | None = None,
+    page_size: int = Query(Config.DEFAULT_PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+    expand: list[ListingExpand] = Query([]),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    loaders: Loaders = Depends(get_loaders),
+) -> ORJSONResponse:
+    """Get a page of the listings registered by the current logged-in user, oldest first."""
+    after = decode_cursor(cursor) if cursor else None
+    response = await fetch_all_listings_of_user(db, current_user.id, after, page_size, with_owner_id=bool(expand))
+    if expand:
+        response['items'] = await expand_listings(response['items'], expand, loaders)
+    return ORJSONResponse(response)
+
+
+@listings.get('/getAllListings/', tags=['Listing'], response_model=ListingPage)
+async def get_all_listings(
+    cursor: str | None = None,
+    page_size: int = Query(Config.DEFAULT_PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+    expand: list[ListingExpand] = Query([]),
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+    loaders: Loaders = Depends(get_loaders),
+) -> ORJSONResponse:
+    """
+    Get a page of the registered listings, oldest first (with their owners embedded when
+    `expand=owner` is given); pass the returned `next_cursor` as `cursor` to get the next page.
+    Send back the `ETag` of a page as `If-None-Match` to get an empty `304`
+    (without querying the database) while no listing was added, changed or deleted.
+    """
+    after = decode_cursor(cursor) if cursor else None
+
+    # the owners can change while the listings do not, so an expanded page has no `ETag`
+    etag = None
+    if not expand:
+        # the version is read before the page, so a concurrent write can only make the ETag stale, never the page
+        version = await get_collection_version()
+        etag = collection_etag(version) if version is not None else None
+        if etag is not None and etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        if etag is not None:
+            # a lagging replica could miss the writes counted in the version, so the page is read from the primary
+            use_primary(db)
+
+    response = await fetch_all_listings(db, after, page_size, with_owner_id=bool(expand))
+    if expand:
+        response['items'] = await expand_listings(response['items'], expand, loaders)
+    return ORJSONResponse(response, headers=etag_headers(etag))
+
+
+@listings.get('/exportListings/', tags=['Listing'], response_class=StreamingResponse)
+async def export_all_listings(
+    format: ExportFormat = ExportFormat.NDJSON,
+    current_user: Principal = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Export every registered listing, oldest first, as NDJSON (one JSON object per line) or CSV;
+    the rows are streamed from a server-side cursor as they are read, in constant memory.
+    """
+    extension = format.value.lower()
+    return StreamingResponse(
+        export_listings(format),
+        media_type=MEDIA_TYPES[format],
+        headers={'Content-Disposition': f'attachment; filename="listings.{extension}"'},
+    )
+
+
+@listings.get('/getListingStats/', tags=['Listing'], response_model=ListingStatsView)
+async def get_listing_stats(
+    owner_id: str | None = None,
+    top_owners: int = Query(Config.DEFAULT_TOP_OWNERS, ge=1, le=Config.MAX_TOP_OWNERS),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+) -> dict:
+    """
+    Get the number of listings in total, by type, by availability and for the owners
+    with the most listings (or only for `owner_id`), read from maintained counters.
+    """
+    return await fetch_listing_stats(db, top_owners, owner_id)
+
+
+@listings.get('/searchListings/', tags=['Listing'], response_model=ListingPage)
+async def get_searched_listings(
+    type: ListingType | None = None,
+    available_now: bool | None = None,
+    owner_id: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    updated_after: datetime | None = None,
+    updated_before: datetime | None = None,
+    sort: ListingSort = ListingSort.NEWEST,
+    cursor: str | None = None,
+    page_size: int = Query(Config.DEFAULT_PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+    expand: list[ListingExpand] = Query([]),
+    db: AsyncSession = Depends(get_read_db),
+    loaders: Loaders = Depends(get_loaders),
+) -> ORJSONResponse:
+    """
+    Search the registered listings by type, availability, owner and date ranges (with their
+    owners embedded when `expand=owner` is given); pass the returned `next_cursor` as `cursor`
+    (with the same filters) to get the next page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    response = await search_listings(
+        db,
+        type=type.value if type else None,
+        available_now=available_now,
+        owner_id=owner_id,
+        created_after=created_after,
+        created_before=created_before,
+        updated_after=updated_after,
+        updated_before=updated_before,
+        sort=sort,
+        after=after,
+        page_size=page_size,
+        with_owner_id=bool(expand),
+    )
+    if expand:
+        response['items'] = await expand_listings(response['items'], expand, loaders)
+    return ORJSONResponse(response)
+
+
+@listings.get('/searchAddress/', tags=['Listing'], response_model=list[AddressMatch])
+async def get_listings_by_address(
+    q: str = Query(..., min_length=3, max_length=255),
+    limit: int = Query(Config.DEFAULT_ADDRESS_RESULTS, ge=1, le=Config.MAX_ADDRESS_RESULTS),
+    db: AsyncSession = Depends(get_read_db),
+) -> ORJSONResponse:
+    """Search the registered listings by (a part of, or a misspelled) address, best matches first."""
+    response = await search_addresses(db, q, limit)
+    return ORJSONResponse(response)
+
+
+@listings.get('/autocompleteAddress/', tags=['Listing'], response_model=list[AddressSuggestion])
+async def get_address_suggestions(
+    q: str = Query(..., min_length=3, max_length=255),
+    limit: int = Query(Config.DEFAULT_ADDRESS_RESULTS, ge=1, le=Config.MAX_ADDRESS_RESULTS),
+    db: AsyncSession = Depends(get_read_db),
+) -> ORJSONResponse:
+    """
+    Suggest addresses whose words start with the typed words, served from the in-process
+    address index when it is enabled, and from the trigram address search otherwise.
+    """
+    if address_index.ready:
+        return ORJSONResponse(address_index.search(q, limit))
+    response = await search_addresses(db, q, limit)
+    return ORJSONResponse([{'id': listing['id'], 'address': listing['address']} for listing in response])
 
 
 @listings.post('/addListing/', tags=['Listing'])
-async def add_listing(listing: ListingAdd, user_id: str = Depends(get_current_user)) -> dict[str, str]:
+async def add_listing(listing: ListingAdd, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)) -> dict[str, str]:
     """Add a new listing for the current logged-in user."""
     current_time = datetime.utcnow()
 
     listing = listing.dict()
     listing.update({
-        'owner_id': user_id,
+        'owner_id': current_user.id,
         'created_at': current_time,
         'updated_at': current_time,
     })
 
-    response = await insert_listing(listing)
+    response = await insert_listing(db, listing)
     if response:
         return response
     raise error_message[400]
 
 
+@listings.post('/importListings/', tags=['Listing'], response_model=ListingImportReport)
+async def bulk_add_listings(
+    file: UploadFile,
+    format: ExportFormat = ExportFormat.NDJSON,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    """
+    Add the listings of an uploaded NDJSON or CSV file (with a header line) for the current logged-in user;
+    every row is validated like `/addListing/`, invalid rows are reported by their line number and skipped.
+    """
+    return await import_listings(db, file.file, format, current_user.id)
+
+
 @listings.put('/updateListing/', tags=['Listing'])
-async def edit_listing(listing: ListingUpdate, listing_id: str, user_id: str = Depends(get_current_user)) -> dict[str, str]:
+async def edit_listing(listing: ListingUpdate, listing_id: str, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)) -> dict[str, str]:
     """Edit a listing's availability by its id."""
-    listing_in_database = await fetch_listing_by_id(listing_id)
+    listing_in_database = await fetch_listing_by_id(db, listing_id)
+    if 'NoListingsFoundError' in listing_in_database:
+        raise error_message[404]
 
-    if not user_id == listing_in_database.get('user_id'):
+    if not current_user.id == listing_in_database.get('owner_id'):
         raise error_message[401]
     
+    listing = listing.dict()
     listing.update({'updated_at': datetime.utcnow()})
-    response = await update_listing(listing_id, **listing)
+    response = await update_listing(db, listing_id, **listing)
     if response:
         return response
     raise error_message[400]
 
 
 @listings.delete('/deleteListing/', tags=['Listing'])
-async def remove_listing(listing_id: str, user_id: str = Depends(get_current_user)) -> dict[str, str]:
+async def remove_listing(listing_id: str, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)) -> dict[str, str]:
     """Delete a listing by its id."""
-    listing_in_database = await fetch_listing_by_id(listing_id)
+    listing_in_database = await fetch_listing_by_id(db, listing_id)
+    if 'NoListingsFoundError' in listing_in_database:
+        raise error_message[404]
 
-    if user_id != listing_in_database.get('owner_id'):
+    if current_user.id != listing_in_database.get('owner_id'):
         raise error_message[401]
 
-    response = await delete_listing(listing_id)
+    response = await delete_listing(db, listing_id)
     if response:
         return response
     raise error_message[400]
 
 
-@listings.delete('/deleteUserListings/', tags=['Listing'])
-async def remove_user_listings(user_id: str = Depends(get_current_user)) -> dict[str, str]:
-    """Delete all the listings registered by the current logged-in user."""
-    response = await delete_user_listings(user_id)
-    if response:
-        return response
-    raise error_message[400]
+@listings.delete('/deleteUserListings/', tags=['Listing'], response_model=JobView, status_code=202)
+async def remove_user_listings(current_user: Principal = Depends(get_current_user)) -> dict:
+    """
+    Delete all the listings registered by the current logged-in user, in chunks as a background job;
+    follow its progress with `/jobs/getJob/{job_id}`.
+    """
+    job = await jobs.submit('delete_user_listings', current_user.id, owner_id=current_user.id)
+    return job.view()
 
 
-@listings.delete('/deleteAllListings/', tags=['Listing'])
-async def remove_all_listings(user_id: str = Depends(get_current_user)) -> dict[str, str]:
-    """[SUPERUSER-ONLY] Delete all the registered listings."""
-    current_user = fetch_user_by_id(user_id)
-    if current_user.get('is_supermodel') == False:
-        raise error_message[403]
+@listings.delete('/deleteAllListings/', tags=['Listing'], response_model=JobView, status_code=202)
+async def remove_all_listings(current_user: Principal = Depends(get_current_superuser)) -> dict:
+    """[SUPERUSER-ONLY] Delete all the registered listings, in chunks as a background job."""
+    job = await jobs.submit('delete_all_listings', current_user.id)
+    return job.view()
 
-    response = await delete_all_listings()
-    if response:
-        return response
-    raise error_message[400]
+
+@listings.get('/getCacheStats/', tags=['Listing'])
+async def get_cache_stats(current_user: Principal = Depends(get_current_superuser)) -> dict:
+    """[SUPERUSER-ONLY] Get the hit/miss/eviction counters of this worker's listing cache, and of its miss coalescing."""
+    return {**listing_cache.stats(), 'single_flight': listing_flight.stats()}
@@ -11,6 +11,11 @@ def test_get_all_listings():
     assert response.status_code == 200
 
 
+def test_get_all_listings_with_invalid_cursor():
+    response = client.get('api/v1/listings/getAllListings/', params={'cursor': 'not-a-cursor'})
+    assert response.status_code == 400
+
+
 # def test_get_listing():
 #     example_id = '12ae17134a394c2a8d621604689a42ce'
 #     response = client.get(f'api/v1/listings/getListing/{example_id}/')
@@ -1,119 +1,108 @@
 from datetime import datetime
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import Config, error_message
+from database import get_db, get_read_db
 from crud.user import (
-    delete_all_users,
-    fetch_user_by_id,
+    delete_all_users_in_chunks,
+    fetch_credentials_by_id,
     fetch_user_by_username,
     fetch_all_users,
     update_password,
     update_user,
     delete_user,
 )
-from schemas import UserUpdate, UserView
-from authentication.password_handler import hash_password, verify_password
-from authentication.authentication_handler import get_current_user
+from schemas import UserUpdate, UserView, Principal, JobView
+from authentication.password_handler import async_hash_password, async_verify_password
+from authentication.authentication_handler import get_current_user, get_current_superuser
 from authentication.token_caching import revoke_token
 from utils.fake_generator import generate_fake_users
+from utils.jobs import jobs, with_session
 
 
 users = APIRouter(prefix=Config.USERS_PREFIX)
 
+# the heavy superuser operations run as background jobs
+jobs.register('generate_fake_users', with_session(generate_fake_users))
+jobs.register('delete_all_users', with_session(delete_all_users_in_chunks))
 
-@users.get('/getUser/', tags=['User'], response_model=UserView | dict[str, str])
-async def get_user_by_username(username: str, user_id: str = Depends(get_current_user)) -> dict[str, str]:
+
+@users.get('/getUser/', tags=['User'], response_model=UserView)
+async def get_user_by_username(username: str, current_user: Principal = Depends(get_current_superuser), db: AsyncSession = Depends(get_read_db)) -> dict:
     """[SUPERUSER-ONLY] Get a user's info by its username."""
-    current_user = await fetch_user_by_id(user_id)
-    if current_user.get('is_supermodel') == False:
-        raise error_message[403]
-    
-    response = await fetch_user_by_username(username)
-    if response:
-        return response
-    raise error_message[400]
+    response = await fetch_user_by_username(db, username)
+    if 'NoUsersFoundError' in response:
+        raise error_message[404]
+    return response
 
 
-@users.get('/getAllUsers/', tags=['User'], response_model=list[UserView] | list[dict[str, str]])
-async def get_all_users(user_id: str = Depends(get_current_user)) -> list[dict[str, str]]:
+@users.get('/getAllUsers/', tags=['User'], response_model=list[UserView])
+async def get_all_users(current_user: Principal = Depends(get_current_superuser), db: AsyncSession = Depends(get_read_db)) -> list[dict]:
     """[SUPERUSER-ONLY] Get all registered users' info."""
-    current_user = await fetch_user_by_id(user_id)
-    if current_user.get('is_supermodel') == False:
-        raise error_message[403]
+    return await fetch_all_users(db)
 
-    response = await fetch_all_users()
-    if response:
-        return response
-    raise error_message[400]
 
-
-@users.post('/generateFakeUsers/', tags=['User'])
-async def generate_random_users(user_id: str = Depends(get_current_user), n: int = 3) -> dict[str, str]:
-    """[SUPERUSER-ONLY] Inserts `n` random fake users."""
-    current_user = await fetch_user_by_id(user_id)
-    if current_user.get('is_supermodel') == False:
-        raise error_message[403]
-    
-    response = await generate_fake_users(n=n)
-    if response:
-        return response
-    raise error_message[400]
+@users.post('/generateFakeUsers/', tags=['User'], response_model=JobView, status_code=202)
+async def generate_random_users(current_user: Principal = Depends(get_current_superuser), n: int = Query(3, ge=1)) -> dict:
+    """
+    [SUPERUSER-ONLY] Inserts `n` random fake users, in batches as a background job;
+    follow its progress with `/jobs/getJob/{job_id}`.
+    """
+    job = await jobs.submit('generate_fake_users', current_user.id, n=n)
+    return job.view()
 
 
 @users.put('/updatePassword/', tags=['User'])
-async def edit_password(old_password: str, new_password: str, user_id: str = Depends(get_current_user)) -> dict[str, str]:
+async def edit_password(old_password: str, new_password: str, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)) -> dict[str, str]:
     """Edit the current logged-in user's password."""
     if not old_password or not new_password:
         return {'EmptyFieldsError': 'You must fill both the new password field and the old password field'}
     
-    user = await fetch_user_by_id(user_id)
+    user = await fetch_credentials_by_id(db, current_user.id)
     password_in_database = user.get('password')
-    
-    if not verify_password(old_password, password_in_database):
+
+    # the read transaction is ended, so the pooled connection is not held while the passwords are hashed
+    await db.rollback()
+    if not await async_verify_password(old_password, password_in_database):
         return {'PasswordError': 'Current password is incorrect'}
     
     if old_password == new_password:
         return {'PasswordError': 'The new password entered is same as the current password; Enter a new one'}
     
-    new_password = hash_password(new_password)
-    response = await update_password(user_id, new_password)
+    new_password = await async_hash_password(new_password)
+    response = await update_password(db, current_user.id, new_password)
     if response:
         # we should revoke the current token
-        revoke_token(user_id)
+        await revoke_token(current_user.id)
         return response
     raise error_message[400]
 
 
 @users.put('/updateUser/', tags=['User'])
-async def edit_user(user: UserUpdate, user_id: str = Depends(get_current_user)) -> dict[str, str]:
+async def edit_user(user: UserUpdate, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)) -> dict[str, str]:
     """Edit the current logged-in user's info."""
     user = {key: value for key, value in user.dict().items() if value != '' and value != None}
     user.update({'updated_at': datetime.utcnow()})
 
-    response = await update_user(user_id, **user)
+    response = await update_user(db, current_user.id, **user)
     if response:
         return response
     raise error_message[400]
 
 
 @users.delete('/deleteUser/', tags=['User'])
-async def remove_user(user_id: str = Depends(get_current_user)) -> dict[str, str]:
+async def remove_user(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)) -> dict[str, str]:
     """Delete the current logged-in user's account."""
-    response = await delete_user(user_id)
+    response = await delete_user(db, current_user.id)
     if response:
         return response
     raise error_message[400]
 
 
-@users.delete('/deleteAllUsers/', tags=['User'])
-async def remove_all_users(user_id: str = Depends(get_current_user)) -> dict[str, str]:
-    """[SUPERUSER-ONLY] Delete every registered user."""
-    current_user = await fetch_user_by_id(user_id)
-    if current_user.get('is_supermodel') == False:
-        raise error_message[403]
-
-    response = await delete_all_users()
-    if response:
-        return response
-    raise error_message[400]
+@users.delete('/deleteAllUsers/', tags=['User'], response_model=JobView, status_code=202)
+async def remove_all_users(current_user: Principal = Depends(get_current_superuser)) -> dict:
+    """[SUPERUSER-ONLY] Delete every registered user (and their listings), in chunks as a background job."""
+    job = await jobs.submit('delete_all_users', current_user.id)
+    return job.view()
@@ -2,12 +2,15 @@ from jose import jwt, JWTError
 
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import Config, error_message
-from schemas import UserLogin
+from schemas import Principal
 from caching import redis_client
-from crud.user import fetch_user_by_username, fetch_user_by_id
-from authentication.password_handler import verify_password
+from database import get_read_db, use_primary
+from crud.user import fetch_credentials_by_username, fetch_user_by_id
+from authentication.password_handler import async_verify_password
+from authentication.principal_caching import principal_cache
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=Config.TOKEN_URL)
@@ -18,21 +21,33 @@ rate = Config.RATE_LIMIT
 rate_expiry = Config.RATE_LIMIT_EXPIRY_IN_SECONDS
 
 
-async def authenticate_user(username: str, password: str) -> bool:
-    """function for checking user's credentials."""
-    user_in_database = await fetch_user_by_username(username)
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> str:
+    """function for checking user's credentials, returns the id of the user."""
+    user_in_database = await fetch_credentials_by_username(db, username)
     if user_in_database.get('NoUsersFoundError') is not None:
         raise error_message[401]
 
-    user_in_database = UserLogin(**user_in_database)
-    if verify_password(password, user_in_database.password) == False:
+    # the read transaction is ended, so the pooled connection is not held while the hash is queued and checked
+    await db.rollback()
+    if await async_verify_password(password, user_in_database['password']) == False:
         raise error_message[401]
     
-    return True
+    return user_in_database['id']
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict[str, str]:
-    """function for extracting the user of the token."""
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_read_db)) -> Principal:
+    """
+    function for extracting the user of the token, recently
+    verified tokens are served from the principal cache.
+
+    The user is read on the read-only session of the request (the one the read routes use too),
+    and its transaction is ended right away, so no connection is held idle through the request.
+    """
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
+    generation = principal_cache.generation
     try:
         payload = jwt.decode(token, secret, algorithms=[algorithm])
         user_id = payload.get('sub')
@@ -41,14 +56,29 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict[str, str
 
         # checking if the token exists inside the redis database
         key = f'user_token:{user_id}'
-        stored_token = redis_client.get(key)
+        stored_token = await redis_client.get(key)
         if stored_token is None or stored_token.decode() != token:
             raise error_message[401]
     except JWTError:
         raise error_message[401]
 
-    user = await fetch_user_by_id(user_id)
+    user = await fetch_user_by_id(db, user_id)
+    if user.get('NoUsersFoundError') is not None:
+        # a user who just signed up may not have reached a lagging replica yet
+        use_primary(db)
+        user = await fetch_user_by_id(db, user_id)
+    await db.rollback()
     if user.get('NoUsersFoundError') is not None:
         raise error_message[401]
 
-    return user['id']
+    principal = Principal(id=user['id'], is_superuser=user['is_superuser'])
+    # cached until the token's own `expiry_date` at the latest
+    principal_cache.set(token, principal, payload.get('expiry_date', 0), generation)
+    return principal
+
+
+async def get_current_superuser(current_user: Principal = Depends(get_current_user)) -> Principal:
+    """function for making sure the user of the token is a superuser."""
+    if not current_user.is_superuser:
+        raise error_message[403]
+    return current_user
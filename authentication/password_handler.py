@@ -1,8 +1,19 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
 from passlib.context import CryptContext
 
+from config import Config, error_message
+from utils.metrics import password_hash_queue_depth
+
 
 password_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
+# bcrypt is CPU-bound, so the async variants run it in a pool of worker processes;
+# the semaphore bounds the number of calls running or queued inside the pool
+executor: ProcessPoolExecutor | None = None
+slots = asyncio.Semaphore(Config.PASSWORD_HASH_WORKERS + Config.PASSWORD_HASH_QUEUE_SIZE)
+
 
 def hash_password(password: str):
     """function for hashing a plain string password."""
@@ -15,3 +26,51 @@ def verify_password(plain_password: str, hashed_password: str):
     its hashed version for authentication purposes.
     """
     return password_context.verify(plain_password, hashed_password)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """function for lazily starting the password hashing process pool."""
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=Config.PASSWORD_HASH_WORKERS)
+    return executor
+
+
+def shutdown_executor() -> None:
+    """function for stopping the password hashing process pool."""
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
+
+
+async def run_in_pool(function, *args):
+    """
+    function for running a password function inside the process pool, without
+    blocking the event loop; once the pool and its queue are full, callers wait
+    for a free slot and get a `503` if none frees up in time.
+    """
+    password_hash_queue_depth.inc()
+    try:
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=Config.PASSWORD_HASH_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise error_message[503]
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_executor(), function, *args)
+        finally:
+            slots.release()
+    finally:
+        password_hash_queue_depth.dec()
+
+
+async def async_hash_password(password: str) -> str:
+    """async variant of `hash_password`, running inside the process pool."""
+    return await run_in_pool(hash_password, password)
+
+
+async def async_verify_password(plain_password: str, hashed_password: str) -> bool:
+    """async variant of `verify_password`, running inside the process pool."""
+    return await run_in_pool(verify_password, plain_password, hashed_password)
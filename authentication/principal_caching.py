@@ -0,0 +1,77 @@
+import json
+import time
+import asyncio
+
+from redis.exceptions import RedisError
+
+from config import Config
+from schemas import Principal
+from caching import redis_client
+from utils.cache import LRUCache, listen_for_invalidations
+
+
+class PrincipalCache:
+    """
+    In-process cache of verified tokens and the principal they belong to, sparing
+    `get_current_user` the Redis and database round trips for `ttl` seconds.
+
+    Invalidating a user drops their tokens on every worker, through a Redis channel; a token
+    is never cached past its own expiry.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.local = LRUCache(maxsize, ttl)
+        self.ttl = ttl
+        self.channel = 'principal_invalidation'
+        self.generation = 0  # bumped by every invalidation, so a token verified before one is not cached after it
+        self.listener: asyncio.Task | None = None
+
+    def get(self, token: str) -> Principal | None:
+        """Return the principal of an already verified token, if it is still cached."""
+        return self.local.get(token)
+
+    def set(self, token: str, principal: Principal, expires_at: float, generation: int) -> None:
+        """
+        Cache the principal of a token verified at `generation`, until the token's expiry
+        (`expires_at`, a UNIX timestamp) at the latest.
+        """
+        ttl = min(self.ttl, expires_at - time.time())
+        if ttl > 0 and generation == self.generation:
+            self.local.set(token, principal, ttl)
+
+    def drop_local(self, user_id: str | None) -> None:
+        """Drop the cached tokens of a user from this worker (`None` drops every token)."""
+        self.generation += 1
+        if user_id is None:
+            self.local.clear()
+            return
+        for token, (_, principal) in list(self.local.entries.items()):
+            if principal.id == user_id:
+                self.local.pop(token)
+
+    async def invalidate(self, user_id: str | None) -> None:
+        """Drop the cached tokens of a user (`None` drops every token) on every worker."""
+        self.drop_local(user_id)
+        try:
+            await redis_client.publish(self.channel, json.dumps(user_id))
+        except RedisError:
+            pass
+
+    def start(self) -> None:
+        """Start listening to the invalidations of other workers in the background."""
+        self.listener = asyncio.create_task(
+            listen_for_invalidations(self.channel, self.drop_local, lambda: self.drop_local(None))
+        )
+
+    async def stop(self) -> None:
+        """Stop listening to the invalidations of other workers."""
+        if self.listener is not None:
+            self.listener.cancel()
+            await asyncio.gather(self.listener, return_exceptions=True)
+            self.listener = None
+
+
+# cache of the principals of recently verified tokens
+principal_cache = PrincipalCache(
+    maxsize=Config.PRINCIPAL_CACHE_SIZE,
+    ttl=Config.PRINCIPAL_CACHE_TTL,
+)
@@ -1,27 +1,33 @@
 from caching import redis_client
 from config import Config, error_message
+from authentication.principal_caching import principal_cache
 
 
-def store_token(token: str, user_id: str):
+async def store_token(token: str, user_id: str):
     """
     function for storing users tokens for limiting each
     user to be logged-in on one device-only at a time.
     """
     try:
         key = f'user_token:{user_id}'
-        redis_client.set(key, token)
-        redis_client.expire(key, Config.JWT_EXPIRY_TIME)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(key, token)
+            pipe.expire(key, Config.JWT_EXPIRY_TIME)
+            await pipe.execute()
+        # the previous token of the user may still be cached by the workers
+        await principal_cache.invalidate(user_id)
     except:
         raise error_message[400]
 
 
-def revoke_token(user_id: str):
+async def revoke_token(user_id: str):
     """
     function for revoking a user's token, in cases
     like when the user changes their password, etc.
     """
     try:
         key = f'user_token:{user_id}'
-        redis_client.delete(key)
+        await redis_client.delete(key)
+        await principal_cache.invalidate(user_id)
     except:
         raise error_message[400]
@@ -0,0 +1,276 @@
+"""
+Load-testing benchmark of the API, reporting latency percentiles and throughput per scenario as JSON.
+
+It drives the FastAPI `app` in-process over an ASGI transport (the startup and shutdown
+hooks are run by the benchmark), or a running server with `--url`. The data set is seeded
+first: `--users` fake users through `generate_fake_users`, plus `--listings` fake listings
+(through `generate_fake_listings`) owned by the benchmark users signed up by the `signup`
+scenario. Then every scenario sends `--requests` requests with `--concurrency` clients:
+
+    signup         POST /auth/signup/ (bcrypt hashing)
+    login          POST /auth/token/ (bcrypt verification)
+    get_listing    GET  /listings/getListing/{id}, authenticated
+    user_listings  GET  /listings/getUserListings/{id}, authenticated
+    add_listing    POST /listings/addListing/, authenticated
+    update_listing PUT  /listings/updateListing/, authenticated
+    all_listings   GET  /listings/getAllListings/, following the cursors
+    search         GET  /listings/searchListings/
+
+    python -m benchmarks.api_load --concurrency 20 --requests 500 --output before.json
+    python -m benchmarks.api_load --url http://localhost:8000 --scenarios get_listing all_listings
+
+Requires a running PostgreSQL and Redis configured through the usual environment variables
+(e.g. `docker compose up -d postgres redis`), as the seeding writes to the database directly.
+In-process, the rate limits are lifted unless `--keep-rate-limits` is given; a server
+started separately keeps them, so keep `signup` and `login` under its limits there.
+"""
+import sys
+import time
+import json
+import random
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+from sqlalchemy.future import select
+
+from config import Config
+from models import User, Listing
+from database import async_session
+from crud.user import delete_user
+from utils import rate_limit
+from utils.fake_generator import generate_fake_users, generate_fake_listings
+from benchmarks.redis_event_loop import percentile
+
+
+SCENARIOS = [
+    'signup', 'login', 'get_listing', 'user_listings',
+    'add_listing', 'update_listing', 'all_listings', 'search',
+]
+PASSWORD = 'Benchmark1234'
+
+
+class Benchmark:
+    """The shared state of a benchmark run: the client, the benchmark users and the seeded listings."""
+    def __init__(self, client: httpx.AsyncClient, users: int):
+        self.client = client
+        self.run_id = f'{int(time.time()):x}'
+        self.usernames = [f'bench{self.run_id}_{index}' for index in range(users)]
+        self.tokens: dict[str, str] = {}
+        self.listing_ids: list[str] = []
+        self.owned_listing_ids: dict[str, list[str]] = {}
+        self.signups = 0
+
+    def headers(self, username: str | None = None) -> dict[str, str]:
+        """Return the authorization header of a (random) logged-in benchmark user."""
+        username = username or random.choice(list(self.tokens))
+        return {'Authorization': f'Bearer {self.tokens[username]}'}
+
+    async def login(self, username: str) -> httpx.Response:
+        response = await self.client.post(
+            f'{Config.AUTH_PREFIX}/token/', data={'username': username, 'password': PASSWORD},
+        )
+        if response.status_code == 200:
+            self.tokens[username] = response.json()['access_token']
+        return response
+
+    async def signup(self, _: int) -> httpx.Response:
+        # the first requests sign up the benchmark users, the later ones extra throwaway users
+        username = self.usernames[self.signups] if self.signups < len(self.usernames) else f'bench{self.run_id}_x{self.signups}'
+        self.signups += 1
+        return await self.client.post(f'{Config.AUTH_PREFIX}/signup/', json={
+            'username': username,
+            'email': f'{username}@benchmark.test',
+            'password': PASSWORD,
+            'date_of_birth': '1-1-1990',
+        })
+
+    async def login_scenario(self, index: int) -> httpx.Response:
+        return await self.login(self.usernames[index % len(self.usernames)])
+
+    async def get_listing(self, _: int) -> httpx.Response:
+        return await self.client.get(
+            f'{Config.LISTINGS_PREFIX}/getListing/{random.choice(self.listing_ids)}', headers=self.headers(),
+        )
+
+    async def user_listings(self, _: int) -> httpx.Response:
+        return await self.client.get(f'{Config.LISTINGS_PREFIX}/getUserListings/me', headers=self.headers())
+
+    async def add_listing(self, index: int) -> httpx.Response:
+        return await self.client.post(
+            f'{Config.LISTINGS_PREFIX}/addListing/',
+            json={'type': random.choice(['HOUSE', 'APARTMENT']), 'address': f'{index} Benchmark Avenue'},
+            headers=self.headers(),
+        )
+
+    async def update_listing(self, _: int) -> httpx.Response:
+        username = random.choice([name for name in self.tokens if self.owned_listing_ids.get(name)])
+        return await self.client.put(
+            f'{Config.LISTINGS_PREFIX}/updateListing/',
+            params={'listing_id': random.choice(self.owned_listing_ids[username])},
+            json={'available_now': random.random() < 0.5},
+            headers=self.headers(username),
+        )
+
+    async def all_listings(self, index: int) -> httpx.Response:
+        # every client walks a few pages deep, following the cursors
+        params = {'page_size': Config.DEFAULT_PAGE_SIZE}
+        for _ in range(index % 3 + 1):
+            response = await self.client.get(f'{Config.LISTINGS_PREFIX}/getAllListings/', params=params)
+            next_cursor = response.json().get('next_cursor') if response.status_code == 200 else None
+            if next_cursor is None:
+                break
+            params['cursor'] = next_cursor
+        return response
+
+    async def search(self, _: int) -> httpx.Response:
+        return await self.client.get(f'{Config.LISTINGS_PREFIX}/searchListings/', params={
+            'type': random.choice(['HOUSE', 'APARTMENT']),
+            'available_now': random.choice(['true', 'false']),
+            'sort': random.choice(['NEWEST', 'RECENTLY_UPDATED']),
+        })
+
+
+async def run(name: str, send, requests: int, concurrency: int) -> dict:
+    """function for sending `requests` requests through `concurrency` clients and summarizing them."""
+    latencies, errors, statuses = [], 0, {}
+    pending = iter(range(requests))
+
+    async def client():
+        nonlocal errors
+        for index in pending:
+            start = time.perf_counter()
+            try:
+                response = await send(index)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 'error'
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 'error' or status >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'scenario': name,
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        'requests_per_s': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies, default=0.0) * 1000, 2),
+    }
+
+
+async def seed(benchmark: Benchmark, users: int, listings: int) -> None:
+    """function for seeding the fake users and the listings of the benchmark users."""
+    async with async_session() as db:
+        if users:
+            await generate_fake_users(db, n=users)
+
+        owners = await db.execute(select(User.id, User.username).where(User.username.in_(benchmark.usernames)))
+        owners = dict(owners.all())
+        if listings and owners:
+            await generate_fake_listings(db, list(owners), n=listings)
+
+        rows = await db.execute(select(Listing.id, Listing.owner_id).where(Listing.owner_id.in_(list(owners))))
+        for listing_id, owner_id in rows.all():
+            benchmark.listing_ids.append(listing_id)
+            benchmark.owned_listing_ids.setdefault(owners[owner_id], []).append(listing_id)
+
+
+async def cleanup(benchmark: Benchmark) -> None:
+    """function for deleting every user signed up by the benchmark, along with their listings."""
+    async with async_session() as db:
+        users = await db.execute(select(User.id).where(User.username.like(f'bench{benchmark.run_id}\\_%')))
+        for user_id in users.scalars().all():
+            await delete_user(db, user_id)
+
+
+def current_commit() -> str | None:
+    """function for the commit being benchmarked, so runs can be compared."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def benchmark_api(args: argparse.Namespace) -> dict:
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url.rstrip('/') + Config.API_PREFIX, timeout=60)
+    else:
+        from main import app, startup, shutdown
+        await startup()
+        if not args.keep_rate_limits:
+            rate_limit.rules.clear()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url='http://benchmark' + Config.API_PREFIX, timeout=60,
+        )
+
+    benchmark = Benchmark(client, args.concurrency)
+    results = []
+    try:
+        # the benchmark users are needed by every authenticated scenario, the first signups create them
+        signup = await run('signup', benchmark.signup, max(args.requests, args.concurrency), args.concurrency)
+        if 'signup' in args.scenarios:
+            results.append(signup)
+        if 'login' in args.scenarios:
+            results.append(await run('login', benchmark.login_scenario, args.requests, args.concurrency))
+        # a login revokes the previous token of a user, so every benchmark user logs in once more
+        await asyncio.gather(*(benchmark.login(username) for username in benchmark.usernames))
+        await seed(benchmark, args.users, args.listings)
+
+        scenarios = {
+            'get_listing': benchmark.get_listing,
+            'user_listings': benchmark.user_listings,
+            'add_listing': benchmark.add_listing,
+            'update_listing': benchmark.update_listing,
+            'all_listings': benchmark.all_listings,
+            'search': benchmark.search,
+        }
+        for name, send in scenarios.items():
+            if name not in args.scenarios:
+                continue
+            if name in ('get_listing', 'update_listing') and not benchmark.listing_ids:
+                print(f'[BENCHMARK] skipping {name}, no listings were seeded (see --listings)', file=sys.stderr)
+                continue
+            results.append(await run(name, send, args.requests, args.concurrency))
+    finally:
+        await client.aclose()
+        if not args.keep_data:
+            await cleanup(benchmark)
+        if not args.url:
+            await shutdown()
+
+    return {
+        'commit': current_commit(),
+        'target': args.url or 'asgi',
+        'seeded': {'users': args.users, 'listings': args.listings},
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=10, help='concurrent clients (and benchmark users)')
+    parser.add_argument('--users', type=int, default=0, help='fake users to seed')
+    parser.add_argument('--listings', type=int, default=1000, help='listings to seed')
+    parser.add_argument('--keep-rate-limits', action='store_true')
+    parser.add_argument('--keep-data', action='store_true', help='keep the benchmark users and their listings')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(benchmark_api(args)), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(report + '\n')
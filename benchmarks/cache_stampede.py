@@ -0,0 +1,160 @@
+"""
+Benchmark for a cache stampede on one hot listing, with and without single-flight coalescing.
+
+It seeds one listing through `copy_listings` (removed again afterwards through `delete_listing`,
+so the listing statistics, caches and address index stay right), then fires `--requests` concurrent
+`getListing` lookups of it on a cold cache, spread over `--workers` simulated worker
+processes (each with its own `SingleFlight`), and reports the number of database
+queries and the latency percentiles of each run:
+
+  - uncoalesced: every cache miss queries the database, the way `fetch_listing_by_id` used to
+  - local: the misses of each worker share one query (one query per worker)
+  - distributed: the workers share a Redis lock as well (about one query overall)
+
+    python -m benchmarks.cache_stampede --requests 500 --workers 4
+
+Requires a running PostgreSQL and Redis configured through the usual environment variables.
+"""
+import time
+import json
+import asyncio
+import argparse
+from datetime import datetime
+from functools import partial
+
+from sqlalchemy import event
+
+from config import Config
+from database import engine, async_session, create_all, close
+from crud.listing import load_listing_by_id, copy_listings, delete_listing
+from utils.cache import listing_cache
+from utils.single_flight import SingleFlight
+from benchmarks.redis_event_loop import percentile
+
+
+async def seed() -> str:
+    """function for inserting the hot (owner-less) listing, returning its id."""
+    now = datetime.utcnow()
+    listing = {
+        'type': 'HOUSE',
+        'available_now': True,
+        'owner_id': None,
+        'address': 'Benchmark Stampede Street',
+        'created_at': now,
+        'updated_at': now,
+    }
+    async with async_session() as db:
+        response = await copy_listings(db, [listing])
+    if 'TransactionSuccess' not in response:
+        raise RuntimeError(f'seeding the hot listing failed: {response}')
+    return listing['id']
+
+
+async def unseed(listing_id: str) -> None:
+    """function for deleting the hot listing (and dropping it from the cache)."""
+    async with async_session() as db:
+        await delete_listing(db, listing_id)
+
+
+async def uncoalesced_lookup(listing_id: str, flight: SingleFlight | None) -> dict:
+    """function for one lookup without coalescing, every miss going to the database."""
+    listing = await listing_cache.get(listing_id)
+    if listing is not None:
+        return listing
+    async with async_session() as db:
+        return await load_listing_by_id(db, listing_id)
+
+
+async def coalesced_lookup(listing_id: str, flight: SingleFlight) -> dict:
+    """function for one lookup as `fetch_listing_by_id` does it, through the worker's `SingleFlight`."""
+    listing = await listing_cache.get(listing_id)
+    if listing is not None:
+        return listing
+    async with async_session() as db:
+        return await flight.do(
+            listing_id, partial(load_listing_by_id, db, listing_id), lookup=partial(listing_cache.get, listing_id),
+        )
+
+
+async def run(
+    name: str, lookup, listing_id: str, requests: int, flights: list[SingleFlight | None], queries: list[int],
+) -> dict:
+    await listing_cache.invalidate(listing_id)
+    queries[0] = 0
+    go = asyncio.Event()
+    latencies = []
+    errors = 0
+
+    async def request(flight: SingleFlight | None) -> None:
+        nonlocal errors
+        await go.wait()
+        start = time.perf_counter()
+        try:
+            await lookup(listing_id, flight)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+
+    # the requests are spread over the workers, and all of them start at once
+    tasks = [asyncio.create_task(request(flights[i % len(flights)])) for i in range(requests)]
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    go.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    coalesced = [flight.stats() for flight in flights if flight is not None]
+    return {
+        'mode': name,
+        'db_queries': queries[0],
+        'errors': errors,
+        'coalesced': sum(stats['coalesced'] for stats in coalesced),
+        'lock_waits': sum(stats['lock_waits'] for stats in coalesced),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'total_s': round(elapsed, 3),
+    }
+
+
+async def main(requests: int, workers: int) -> None:
+    await create_all()
+    listing_id = await seed()
+
+    queries = [0]
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def count_listing_queries(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'FROM listings' in statement:
+            queries[0] += 1
+
+    def flights(distributed: bool) -> list[SingleFlight]:
+        return [
+            SingleFlight(
+                f'benchmark-{worker}' if not distributed else 'benchmark',
+                distributed=distributed,
+                lock_ttl=Config.SINGLE_FLIGHT_LOCK_TTL,
+                poll_interval=Config.SINGLE_FLIGHT_POLL_INTERVAL,
+            )
+            for worker in range(workers)
+        ]
+
+    try:
+        results = [
+            await run('uncoalesced (before)', uncoalesced_lookup, listing_id, requests, [None] * workers, queries),
+            await run('local single-flight', coalesced_lookup, listing_id, requests, flights(False), queries),
+            await run('distributed single-flight', coalesced_lookup, listing_id, requests, flights(True), queries),
+        ]
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', count_listing_queries)
+        await unseed(listing_id)
+        await close()
+    print(json.dumps({'requests': requests, 'workers': workers, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500, help='concurrent lookups of the hot listing')
+    parser.add_argument('--workers', type=int, default=4, help='simulated worker processes')
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.workers))
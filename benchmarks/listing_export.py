@@ -0,0 +1,122 @@
+"""
+Benchmark for exporting every listing, materialized at once versus streamed from a server-side cursor.
+
+It optionally seeds `--seed` benchmark listings (removed again afterwards), then exports
+the table once the way `fetch_all_listings` used to build it (every ORM object, then a list
+of dicts, then one JSON document) and once through the streaming export, reporting the
+time to the first byte, the total time and the peak Python memory of each run:
+
+    python -m benchmarks.listing_export --seed 1000000 --format NDJSON
+
+The listings are seeded and removed through the listing `CRUD` functions, so the listing
+statistics, the collection version, the caches and the address index stay right.
+
+Requires a running PostgreSQL configured through the usual environment variables.
+"""
+import time
+import json
+import asyncio
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy.future import select
+
+from config import Config
+from models import Listing
+from schemas import ExportFormat
+from database import async_session, create_all, close
+from crud.listing import copy_listings, delete_listings_in_chunks
+from utils.bulk_query_handler import bulk_query_to_dict
+from utils.export import export_listings
+from utils.jobs import Job
+
+
+SEED_ADDRESS = 'Benchmark Export Street'
+
+
+async def seed(rows: int) -> None:
+    """function for inserting `rows` owner-less listings, one `COPY` batch of `IMPORT_BATCH_SIZE` at a time."""
+    now = datetime.utcnow()
+    async with async_session() as db:
+        for start in range(1, rows + 1, Config.IMPORT_BATCH_SIZE):
+            listings = [
+                {
+                    'type': 'HOUSE' if i % 2 == 0 else 'APARTMENT',
+                    'available_now': i % 3 == 0,
+                    'owner_id': None,
+                    'address': f'{SEED_ADDRESS} {i}',
+                    'created_at': now - timedelta(seconds=i),
+                    'updated_at': now,
+                }
+                for i in range(start, min(rows, start + Config.IMPORT_BATCH_SIZE - 1) + 1)
+            ]
+            response = await copy_listings(db, listings)
+            if 'TransactionSuccess' not in response:
+                raise RuntimeError(f'seeding the benchmark listings failed: {response}')
+
+
+async def unseed() -> None:
+    """function for deleting the seeded benchmark listings, chunk by chunk."""
+    async with async_session() as db:
+        await delete_listings_in_chunks(db, Job('benchmark_unseed', 'benchmark'), Listing.address.startswith(f'{SEED_ADDRESS} '))
+
+
+async def materialized_export() -> tuple[float, int]:
+    """function for the export as one document, the way the listings used to be returned."""
+    async with async_session() as db:
+        listings = await db.execute(select(Listing))
+        body = json.dumps(bulk_query_to_dict(listings.scalars().all())).encode()
+        return time.perf_counter(), len(body)
+
+
+async def streamed_export(format: ExportFormat) -> tuple[float, int]:
+    """function for the streaming export, returning the time of the first chunk and the size."""
+    first_byte, size = None, 0
+    async for chunk in export_listings(format):
+        if first_byte is None:
+            first_byte = time.perf_counter()
+        size += len(chunk)
+    return first_byte, size
+
+
+async def run(name: str, export) -> dict:
+    """function for running an export and summarizing it."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_byte, size = await export()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'scenario': name,
+        'bytes': size,
+        'time_to_first_byte_s': round(first_byte - start, 3),
+        'total_s': round(elapsed, 3),
+        'peak_python_memory_mb': round(peak / 1024 / 1024, 1),
+    }
+
+
+async def main(rows: int, format: ExportFormat, skip_materialized: bool) -> None:
+    await create_all()
+    if rows:
+        await seed(rows)
+    try:
+        results = []
+        if not skip_materialized:
+            results.append(await run('materialized (before)', materialized_export))
+        results.append(await run(f'streamed {format.value} (after)', lambda: streamed_export(format)))
+    finally:
+        if rows:
+            await unseed()
+        await close()
+    print(json.dumps({'seeded_rows': rows, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0, help='benchmark listings to insert first')
+    parser.add_argument('--format', choices=[item.value for item in ExportFormat], default=ExportFormat.NDJSON.value)
+    parser.add_argument('--skip-materialized', action='store_true', help='skip the (memory hungry) materialized export')
+    args = parser.parse_args()
+    asyncio.run(main(args.seed, ExportFormat(args.format), args.skip_materialized))
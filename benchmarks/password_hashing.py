@@ -0,0 +1,82 @@
+"""
+Benchmark for the login password check, inline on the event loop versus inside the process pool.
+
+It runs `logins` concurrent `verify_password` calls, first inline (as the login endpoint
+used to) and then through `async_verify_password` with growing process pool sizes,
+reporting the verifications per second and the worst event-loop stall of each run:
+
+    python -m benchmarks.password_hashing --logins 64 --workers 1 2 4 8
+"""
+import os
+import time
+import json
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from authentication import password_handler
+from authentication.password_handler import hash_password, verify_password, async_verify_password
+
+
+TICK_INTERVAL = 0.005
+
+
+async def measure_loop_lag(stop: asyncio.Event, lags: list[float]) -> None:
+    """function for recording how late the event loop wakes up a sleeping task."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK_INTERVAL)
+        lags.append(time.perf_counter() - start - TICK_INTERVAL)
+
+
+async def run(name: str, verify, logins: int) -> dict:
+    """function for running `logins` concurrent password checks and summarizing them."""
+    stop, lags = asyncio.Event(), []
+    ticker = asyncio.create_task(measure_loop_lag(stop, lags))
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(verify() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    assert all(results)
+
+    stop.set()
+    await ticker
+    return {
+        'scenario': name,
+        'logins': logins,
+        'elapsed_s': round(elapsed, 3),
+        'logins_per_s': round(logins / elapsed, 1),
+        'max_loop_stall_ms': round(max(lags, default=0.0) * 1000, 1),
+    }
+
+
+async def main(logins: int, workers: list[int]) -> None:
+    password = 'Benchmark1234'
+    hashed_password = hash_password(password)
+
+    async def inline_verify():
+        return verify_password(password, hashed_password)
+
+    async def pooled_verify():
+        return await async_verify_password(password, hashed_password)
+
+    results = [await run('inline (before)', inline_verify, logins)]
+    for count in workers:
+        # swap in a pool of the wanted size, warmed up so process start-up is not measured
+        password_handler.shutdown_executor()
+        password_handler.executor = ProcessPoolExecutor(max_workers=count)
+        password_handler.slots = asyncio.Semaphore(count + logins)
+        await asyncio.gather(*(pooled_verify() for _ in range(count)))
+        results.append(await run(f'process pool, {count} workers (after)', pooled_verify, logins))
+
+    password_handler.shutdown_executor()
+    print(json.dumps({'cpu_count': os.cpu_count(), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.workers))
@@ -0,0 +1,81 @@
+"""
+Benchmark for the rate limiter, the old GET/SET/INCR counter versus the atomic GCRA script.
+
+It runs `checks` concurrent checks (spread over `clients` keys) through the in-process
+limiter, and, when Redis is reachable, through the old three-round-trip counter and the
+one-round-trip Lua script, reporting the checks per second and the mean cost of a check:
+
+    python -m benchmarks.rate_limiter --checks 20000 --clients 100
+"""
+import time
+import json
+import asyncio
+import argparse
+
+from redis.exceptions import RedisError
+
+from caching import redis_client
+from utils.rate_limit import RateLimitRule, check_rate_limit, local_limiter
+
+
+RULE = RateLimitRule(limit=1_000_000, period=60)
+
+
+async def old_check(key: str) -> bool:
+    """function for the counter the middleware used before (racy, up to three round trips)."""
+    request_count = await redis_client.get(key)
+    if request_count is None:
+        await redis_client.set(key, 1, ex=RULE.period)
+    elif int(request_count) < RULE.limit:
+        await redis_client.incr(key)
+    else:
+        return False
+    return True
+
+
+async def gcra_check(key: str) -> bool:
+    return (await check_rate_limit(key, RULE)).allowed
+
+
+async def local_check(key: str) -> bool:
+    period = RULE.period * 1000
+    return local_limiter.check(key, period / RULE.limit, period).allowed
+
+
+async def run(name: str, check, checks: int, clients: int) -> dict:
+    """function for running `checks` concurrent checks and summarizing them."""
+    keys = [f'benchmark_rate_limit:{name}:{index}' for index in range(clients)]
+    start = time.perf_counter()
+    results = await asyncio.gather(*(check(keys[index % clients]) for index in range(checks)))
+    elapsed = time.perf_counter() - start
+    assert all(results)
+    return {
+        'scenario': name,
+        'checks': checks,
+        'elapsed_s': round(elapsed, 3),
+        'checks_per_s': round(checks / elapsed, 1),
+        'mean_us_per_check': round(elapsed / checks * 1_000_000, 1),
+    }
+
+
+async def main(checks: int, clients: int) -> None:
+    results = [await run('in-process', local_check, checks, clients)]
+    try:
+        await redis_client.ping()
+    except RedisError as error:
+        print(f'[BENCHMARK] Redis is not reachable, skipping the Redis scenarios: {error!r}')
+    else:
+        results.append(await run('redis GET/SET/INCR (before)', old_check, checks, clients))
+        results.append(await run('redis GCRA script (after)', gcra_check, checks, clients))
+        async for key in redis_client.scan_iter(match='benchmark_rate_limit:*'):
+            await redis_client.unlink(key)
+    await redis_client.close()
+    print(json.dumps({'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checks', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.checks, args.clients))
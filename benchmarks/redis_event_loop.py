@@ -0,0 +1,108 @@
+"""
+Benchmark for the event-loop latency caused by the token check of authenticated requests.
+
+It simulates `concurrency` clients hammering the token check of `get_current_user`
+(JWT decoding + a Redis GET) once with the old synchronous `redis.Redis` client
+and once with the shared asyncio client of `caching.py`, while a ticker task
+measures how late the event loop wakes it up.
+
+Requires a running Redis configured through the usual environment variables:
+
+    python -m benchmarks.redis_event_loop --concurrency 200 --requests 50
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from jose import jwt
+from redis import Redis
+
+from config import Config
+from caching import redis_client, close
+from authentication.token_handler import create_token
+
+
+TICK_INTERVAL = 0.001
+USER_ID = 'benchmark-user'
+KEY = f'user_token:{USER_ID}'
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """function for picking the `percent` percentile out of a list of values."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def measure_loop_lag(stop: asyncio.Event, lags: list[float]) -> None:
+    """function for recording how late the event loop wakes up a sleeping task."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK_INTERVAL)
+        lags.append(time.perf_counter() - start - TICK_INTERVAL)
+
+
+async def run(name: str, check_token, concurrency: int, requests: int) -> dict:
+    """function for running one scenario and summarizing its results."""
+    stop, lags = asyncio.Event(), []
+    ticker = asyncio.create_task(measure_loop_lag(stop, lags))
+
+    async def client():
+        for _ in range(requests):
+            await check_token()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await ticker
+    return {
+        'scenario': name,
+        'requests': concurrency * requests,
+        'elapsed_s': round(elapsed, 4),
+        'rps': round(concurrency * requests / elapsed, 1),
+        'loop_lag_ms': {
+            'mean': round(statistics.fmean(lags) * 1000, 3) if lags else 0.0,
+            'p50': round(percentile(lags, 50) * 1000, 3),
+            'p99': round(percentile(lags, 99) * 1000, 3),
+            'max': round(max(lags, default=0.0) * 1000, 3),
+        },
+    }
+
+
+async def main(concurrency: int, requests: int) -> None:
+    token = create_token({'sub': USER_ID})
+    await redis_client.set(KEY, token, ex=Config.JWT_EXPIRY_TIME)
+
+    sync_client = Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=Config.REDIS_DB)
+
+    async def sync_check():
+        jwt.decode(token, Config.JWT_SECRET, algorithms=[Config.JWT_ALGORITHM])
+        assert sync_client.get(KEY).decode() == token
+
+    async def async_check():
+        jwt.decode(token, Config.JWT_SECRET, algorithms=[Config.JWT_ALGORITHM])
+        assert (await redis_client.get(KEY)).decode() == token
+
+    results = [
+        await run('sync redis.Redis (before)', sync_check, concurrency, requests),
+        await run('redis.asyncio pool (after)', async_check, concurrency, requests),
+    ]
+    print(json.dumps(results, indent=2))
+
+    await redis_client.delete(KEY)
+    sync_client.close()
+    await close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=50, help='requests issued by each concurrent client')
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.requests))
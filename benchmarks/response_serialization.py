@@ -0,0 +1,91 @@
+"""
+Benchmark for the CPU spent per listing page response, validated against a union model versus pre-shaped.
+
+It serves the same synthetic page of `--rows` listings through two endpoints of a bare
+FastAPI app: one returning the dict under `response_model=ListingPage | dict[str, str]`
+(as the listing endpoints used to), one returning it inside an `ORJSONResponse` (as they
+do now), and reports the process CPU time per request of each, no database involved:
+
+    python -m benchmarks.response_serialization --rows 50 200 --requests 500
+"""
+import time
+import json
+import uuid
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+from schemas import ListingPage
+
+
+def make_page(rows: int) -> dict:
+    """function for shaping a page of synthetic listing rows, as `build_page` does."""
+    now = datetime.now(timezone.utc)
+    return {
+        'items': [
+            {
+                'id': uuid.uuid4().hex,
+                'type': 'HOUSE' if index % 2 else 'APARTMENT',
+                'available_now': bool(index % 3),
+                'address': f'{index} Benchmark Street',
+                'created_at': now - timedelta(seconds=index),
+                'updated_at': now,
+            }
+            for index in range(rows)
+        ],
+        'next_cursor': 'WyIyMDI2LTEwLTE4VDEzOjI0OjI0KzAwOjAwIiwiYSJd',
+    }
+
+
+def make_app(page: dict) -> FastAPI:
+    """function for creating an app serving `page` the old and the new way."""
+    app = FastAPI()
+
+    @app.get('/union/', response_model=ListingPage | dict[str, str])
+    async def union():
+        return page
+
+    @app.get('/preshaped/', response_model=ListingPage)
+    async def preshaped():
+        return ORJSONResponse(page)
+
+    return app
+
+
+async def run(name: str, client: httpx.AsyncClient, path: str, rows: int, requests: int) -> dict:
+    """function for sending `requests` sequential requests and summarizing their CPU time."""
+    await client.get(path)  # warm up
+    start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(requests):
+        response = await client.get(path)
+        assert response.status_code == 200
+    cpu, elapsed = time.process_time() - cpu_start, time.perf_counter() - start
+    return {
+        'scenario': name,
+        'rows': rows,
+        'cpu_ms_per_request': round(cpu / requests * 1000, 3),
+        'requests_per_s': round(requests / elapsed, 1),
+        'response_bytes': len(response.content),
+    }
+
+
+async def main(row_counts: list[int], requests: int) -> None:
+    results = []
+    for rows in row_counts:
+        app = make_app(make_page(rows))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark') as client:
+            results.append(await run('union response model (before)', client, '/union/', rows, requests))
+            results.append(await run('pre-shaped ORJSONResponse (after)', client, '/preshaped/', rows, requests))
+    print(json.dumps({'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.requests))
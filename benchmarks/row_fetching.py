@@ -0,0 +1,97 @@
+"""
+Benchmark for fetching listings as ORM objects turned into dicts versus as column-projected rows.
+
+It optionally seeds `--seed` benchmark listings (removed again afterwards), then fetches
+`--rows` listings `--repeat` times each way: hydrated ORM objects run through
+`bulk_query_to_dict` (as the CRUD functions used to) and plain rows of `LISTING_COLUMNS`
+(as they do now), reporting the median latency, the allocated blocks and the peak Python
+memory of a fetch, plus the time FastAPI then spends validating the rows as `ListingView`:
+
+    python -m benchmarks.row_fetching --seed 10000 --rows 10000
+
+Requires a running PostgreSQL configured through the usual environment variables.
+"""
+import time
+import json
+import asyncio
+import argparse
+import statistics
+import tracemalloc
+
+from sqlalchemy.future import select
+
+from models import Listing
+from schemas import ListingView
+from database import async_session, create_all, close
+from crud.listing import LISTING_COLUMNS
+from utils.bulk_query_handler import bulk_query_to_dict
+from benchmarks.listing_export import seed, unseed
+
+
+async def orm_fetch(rows: int) -> list[dict]:
+    """function for the fetch as it used to be, hydrating ORM objects and stringifying every value."""
+    async with async_session() as db:
+        listings = await db.execute(select(Listing).order_by(Listing.created_at, Listing.id).limit(rows))
+        return bulk_query_to_dict(listings.scalars().all())
+
+
+async def projected_fetch(rows: int) -> list[dict]:
+    """function for the column-projected fetch, keeping the native types of the values."""
+    async with async_session() as db:
+        listings = await db.execute(select(*LISTING_COLUMNS).order_by(Listing.created_at, Listing.id).limit(rows))
+        return [row._asdict() for row in listings.all()]
+
+
+async def run(name: str, fetch, rows: int, repeat: int) -> dict:
+    """function for running a fetch `repeat` times and summarizing it."""
+    await fetch(rows)  # warm up the connection pool and the statement caches
+
+    latencies, validations = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = await fetch(rows)
+        latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        [ListingView(**item) for item in items]
+        validations.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    await fetch(rows)
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'scenario': name,
+        'rows': len(items),
+        'median_fetch_ms': round(statistics.median(latencies) * 1000, 1),
+        'median_validation_ms': round(statistics.median(validations) * 1000, 1),
+        'allocated_blocks': sum(stat.count for stat in snapshot.statistics('filename')),
+        'peak_python_memory_mb': round(peak / 1024 / 1024, 1),
+    }
+
+
+async def main(seeded: int, rows: int, repeat: int) -> None:
+    await create_all()
+    if seeded:
+        await seed(seeded)
+    try:
+        results = [
+            await run('ORM objects + bulk_query_to_dict (before)', orm_fetch, rows, repeat),
+            await run('column-projected rows (after)', projected_fetch, rows, repeat),
+        ]
+    finally:
+        if seeded:
+            await unseed()
+        await close()
+    print(json.dumps({'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0, help='benchmark listings to insert first')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.seed, args.rows, args.repeat))
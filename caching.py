@@ -1,10 +1,29 @@
-from redis import Redis
+import asyncio
+
+from redis.asyncio import BlockingConnectionPool
 from config import Config
+from utils.metrics import TimedRedis
 
 
-# Redis client used for caching required data
-redis_client = Redis(
+# shared connection pool; callers wait for a free connection once it is exhausted
+redis_pool = BlockingConnectionPool(
     host=Config.REDIS_HOST,
     port=Config.REDIS_PORT,
     db=Config.REDIS_DB,
+    max_connections=Config.REDIS_MAX_CONNECTIONS,
+    timeout=Config.REDIS_POOL_TIMEOUT,
 )
+
+# asynchronous Redis client used for caching required data, timing every command
+redis_client = TimedRedis(connection_pool=redis_pool)
+
+
+async def warm_up(connections: int) -> None:
+    """function for opening `connections` pooled Redis connections ahead of the first requests."""
+    await asyncio.gather(*(redis_client.ping() for _ in range(min(connections, Config.REDIS_MAX_CONNECTIONS))))
+
+
+async def close() -> None:
+    """function for closing the client and every pooled Redis connection."""
+    await redis_client.close()
+    await redis_pool.disconnect()
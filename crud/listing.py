@@ -1,55 +1,282 @@
+import asyncio
 from uuid import uuid4
+from datetime import datetime
+from functools import partial
+from typing import AsyncIterator
 
-from sqlalchemy import insert, update, delete
+from sqlalchemy import insert, update, delete, tuple_, true, false, func, or_, Row
 from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from models import Listing
-from database import db, transaction
-from utils.bulk_query_handler import bulk_query_to_dict
+from schemas import ListingSort
+from config import Config
+from database import transaction, use_primary
+from utils.pagination import build_page
+from utils.address_index import address_index
+from utils.cache import listing_cache
+from utils.single_flight import listing_flight
+from utils.etag import bump_collection_version
+from utils.jobs import Job
+from utils.query_log import traced
+from crud.stats import stats_deltas, apply_stats_deltas
 
 
-async def fetch_all_listings() -> list[dict[str, str]]:
-    """Fetch all listings from the database."""
-    query = select(Listing)
+# sort orders of the listing search, each one is backed by a `(..., column, id)` index
+SORT_ORDERS = {
+    ListingSort.NEWEST: (Listing.created_at, True),
+    ListingSort.OLDEST: (Listing.created_at, False),
+    ListingSort.RECENTLY_UPDATED: (Listing.updated_at, True),
+}
+
+# columns of a listing as it is shown (exactly the fields of `ListingView`), fetched as plain rows instead of ORM objects
+LISTING_VIEW_COLUMNS = (
+    Listing.id,
+    Listing.type,
+    Listing.available_now,
+    Listing.address,
+    Listing.created_at,
+    Listing.updated_at,
+)
+
+# columns of a listing as it is cached and exported, along with its owner
+LISTING_COLUMNS = (
+    Listing.id,
+    Listing.type,
+    Listing.available_now,
+    Listing.owner_id,
+    Listing.address,
+    Listing.created_at,
+    Listing.updated_at,
+)
+
+
+def keyset_query(
+    after: tuple[datetime, str] | None,
+    page_size: int,
+    column=Listing.created_at,
+    descending: bool = False,
+    with_owner_id: bool = False,
+):
+    """
+    Build a query for a page of listings ordered by `(column, id)`,
+    starting right after the `after` keyset and fetching one extra row to detect a next page;
+    the `owner_id` of the listings is only fetched when asked for (to expand their owner).
+    """
+    columns = LISTING_COLUMNS if with_owner_id else LISTING_VIEW_COLUMNS
+    if descending:
+        query = select(*columns).order_by(column.desc(), Listing.id.desc())
+    else:
+        query = select(*columns).order_by(column, Listing.id)
+    query = query.limit(page_size + 1)
+
+    if after is not None:
+        keyset, bound = tuple_(column, Listing.id), tuple_(*after)
+        query = query.where(keyset < bound if descending else keyset > bound)
+    return query
+
+
+@traced
+async def fetch_all_listings(
+    db: AsyncSession,
+    after: tuple[datetime, str] | None = None,
+    page_size: int = Config.DEFAULT_PAGE_SIZE,
+    with_owner_id: bool = False,
+) -> dict[str, list[dict] | str | None]:
+    """Fetch a page of listings from the database."""
+    query = keyset_query(after, page_size, with_owner_id=with_owner_id)
+    listings = await db.execute(query)
+    listings = listings.all()
+    return build_page(listings, page_size)
+
+
+@traced
+async def fetch_all_listings_of_user(
+    db: AsyncSession,
+    owner_id: str,
+    after: tuple[datetime, str] | None = None,
+    page_size: int = Config.DEFAULT_PAGE_SIZE,
+    with_owner_id: bool = False,
+) -> dict[str, list[dict] | str | None]:
+    """Fetch a page of the listings of a specific user from the database."""
+    query = keyset_query(after, page_size, with_owner_id=with_owner_id).where(Listing.owner_id == owner_id)
     listings = await db.execute(query)
-    listings = listings.scalars().all()
-    if not listings:
-        return [{'NoListingsFoundError': 'No listings are recorded'}]
-    return bulk_query_to_dict(listings)
+    listings = listings.all()
+    return build_page(listings, page_size)
 
 
-async def fetch_all_listings_of_user(owner_id: str) -> list[dict[str, str]]:
-    """Fetch all the listings of a specific user from the database."""
-    query = select(Listing).where(Listing.owner_id == owner_id)
+@traced
+async def search_listings(
+    db: AsyncSession,
+    type: str | None = None,
+    available_now: bool | None = None,
+    owner_id: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    updated_after: datetime | None = None,
+    updated_before: datetime | None = None,
+    sort: ListingSort = ListingSort.NEWEST,
+    after: tuple[datetime, str] | None = None,
+    page_size: int = Config.DEFAULT_PAGE_SIZE,
+    with_owner_id: bool = False,
+) -> dict[str, list[dict] | str | None]:
+    """Search a page of listings matching every given filter from the database."""
+    column, descending = SORT_ORDERS[sort]
+    query = keyset_query(after, page_size, column, descending, with_owner_id)
+
+    if type is not None:
+        query = query.where(Listing.type == type)
+    if available_now is not None:
+        # rendered as a literal so the planner can match the partial `available_now = true` index
+        query = query.where(Listing.available_now == (true() if available_now else false()))
+    if owner_id is not None:
+        query = query.where(Listing.owner_id == owner_id)
+    if created_after is not None:
+        query = query.where(Listing.created_at >= created_after)
+    if created_before is not None:
+        query = query.where(Listing.created_at < created_before)
+    if updated_after is not None:
+        query = query.where(Listing.updated_at >= updated_after)
+    if updated_before is not None:
+        query = query.where(Listing.updated_at < updated_before)
+
     listings = await db.execute(query)
-    listings = listings.scalars().all()
-    if not listings:
-        return [{'NoListingsFoundError': 'No listing was added by the current user'}]
-    return bulk_query_to_dict(listings)
+    listings = listings.all()
+    return build_page(listings, page_size, sort_key=column.key)
+
+
+@traced
+async def search_addresses(db: AsyncSession, text: str, limit: int) -> list[dict]:
+    """
+    Search the listings by their address from the database, matching substrings and
+    (thanks to trigram similarity) misspelled addresses; prefix matches are ranked first.
+    """
+    score = func.similarity(Listing.address, text)
+    query = (
+        select(*LISTING_VIEW_COLUMNS, score.label('score'))
+        .where(or_(Listing.address.icontains(text, autoescape=True), Listing.address.op('%')(text)))
+        .order_by(
+            Listing.address.istartswith(text, autoescape=True).desc(),
+            Listing.address.icontains(text, autoescape=True).desc(),
+            score.desc(),
+            Listing.id,
+        )
+        .limit(limit)
+    )
+    rows = await db.execute(query)
+    return [row._asdict() for row in rows.all()]
+
+
+@traced
+async def fetch_listing_addresses(db: AsyncSession) -> list[tuple[str, str]]:
+    """Fetch the id and address of every listing from the database (for the address index)."""
+    query = select(Listing.id, Listing.address)
+    rows = await db.execute(query)
+    return [tuple(row) for row in rows.all()]
+
+
+@traced
+async def stream_listings(db: AsyncSession, batch_size: int) -> AsyncIterator[list[Row]]:
+    """
+    Stream every listing (oldest first) from the database through a server-side cursor,
+    `batch_size` plain rows at a time, so the table is never loaded in memory as a whole.
+    """
+    query = (
+        select(*LISTING_COLUMNS)
+        .order_by(Listing.created_at, Listing.id)
+        .execution_options(yield_per=batch_size)
+    )
+    rows = await db.stream(query)
+    async for batch in rows.partitions():
+        yield batch
 
 
-async def fetch_listing_by_id(id: str) -> dict[str, str]:
-    """Fetch a certain listing by its id from the database."""
-    query = select(Listing).where(Listing.id == id)
+@traced
+async def fetch_listing_by_id(db: AsyncSession, id: str) -> dict:
+    """Fetch a certain listing by its id from the cache, or from the database on a cache miss."""
+    listing = await listing_cache.get(id)
+    if listing is not None:
+        return listing
+
+    # the concurrent misses of the same listing share a single query
+    return await listing_flight.do(id, partial(load_listing_by_id, db, id), lookup=partial(listing_cache.get, id))
+
+
+@traced
+async def load_listing_by_id(db: AsyncSession, id: str) -> dict:
+    """Fetch a certain listing by its id from the database (the primary, never a lagging replica), and cache it."""
+    use_primary(db)
+    # read before the row, so a write committed (and invalidated) meanwhile keeps the row read out of the cache
+    generation = await listing_cache.generation(id)
+    query = select(*LISTING_COLUMNS).where(Listing.id == id)
     listing = await db.execute(query)
-    listing = listing.scalar()
+    listing = listing.first()
     if listing:
-        listing = listing.__dict__
+        listing = listing._asdict()
+        await listing_cache.set(id, listing, generation)
         return listing
     return {'NoListingsFoundError': 'No listing was found with this id'}
 
 
-async def insert_listing(listing: dict) -> dict[str, str]:
+@traced
+async def insert_listing(db: AsyncSession, listing: dict) -> dict[str, str]:
     """Insert a new listing inside the database."""
     listing.update({'id': uuid4().hex})  # first add a new random ID to the listing values
     stmt = insert(Listing).values(**listing)
     
     await db.execute(stmt)
-    return await transaction(msg=f'Listing successfully added: {listing}')
+    await apply_stats_deltas(db, stats_deltas([(listing['type'], listing['available_now'], listing['owner_id'], 1)]))
+    response = await transaction(db, msg=f'Listing successfully added: {listing}')
+    if 'TransactionSuccess' in response:
+        address_index.add(listing['id'], listing['address'])
+        await bump_collection_version()
+    return response
+
 
+@traced
+async def copy_listings(db: AsyncSession, listings: list[dict]) -> dict[str, str]:
+    """
+    Insert a batch of new listings inside the database with one `COPY`,
+    which is loaded (or rejected) as a whole; every listing gets a new random ID.
+    """
+    columns = [column.key for column in LISTING_COLUMNS]
+    for listing in listings:
+        listing.update({'id': uuid4().hex})
+    records = [tuple(listing[column] for column in columns) for listing in listings]
+    deltas = stats_deltas((listing['type'], listing['available_now'], listing['owner_id'], 1) for listing in listings)
 
-async def update_listing(id: str, **kwargs) -> dict[str, str]:
+    try:
+        # the asyncpg adapter only begins its transaction with the first statement, which has to come
+        # before the `COPY` (run on the driver's connection, it would autocommit otherwise); the counters
+        # are updated last, as in `insert_listing`, so their hot rows are not locked through the whole `COPY`
+        connection = await db.connection()
+        await connection.exec_driver_sql('SELECT 1')
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            Listing.__tablename__, records=records, columns=columns,
+        )
+        await apply_stats_deltas(db, deltas)
+    except Exception as error:
+        await db.rollback()
+        return {'TransactionError': f'The batch was rejected by the database: {error}'}
+
+    response = await transaction(db, msg=f'{len(listings)} listings successfully added')
+    if 'TransactionSuccess' in response:
+        for listing in listings:
+            address_index.add(listing['id'], listing['address'])
+        await bump_collection_version()
+    return response
+
+
+@traced
+async def update_listing(db: AsyncSession, id: str, **kwargs) -> dict[str, str]:
     """Update a certain listing by its id with new information (only the availability)."""
+    # the current row is locked until the commit, so its counters are moved exactly once
+    current = await db.execute(
+        select(Listing.type, Listing.available_now, Listing.owner_id).where(Listing.id == id).with_for_update()
+    )
+    current = current.first()
+
     stmt = (
         update(Listing)
         .where(Listing.id == id)
@@ -58,37 +285,85 @@ async def update_listing(id: str, **kwargs) -> dict[str, str]:
     )
 
     await db.execute(stmt)
-    return await transaction(msg='Listing successfully updated')
+    if current is not None and 'available_now' in kwargs and kwargs['available_now'] != current.available_now:
+        deltas = stats_deltas([(*current, -1)])
+        deltas.update(stats_deltas([(current.type, kwargs['available_now'], current.owner_id, 1)]))
+        await apply_stats_deltas(db, deltas)
+    response = await transaction(db, msg='Listing successfully updated')
+    if 'TransactionSuccess' in response:
+        await listing_cache.invalidate(id)
+        await bump_collection_version()
+    return response
 
 
-async def delete_listing(id: str) -> dict[str, dict[str, str] | str]:
+@traced
+async def delete_listing(db: AsyncSession, id: str) -> dict[str, dict[str, str] | str]:
     """Delete a certain listing by its id from the database."""
-    stmt = delete(Listing).where(Listing.id == id).returning(Listing.id, Listing.owner_id)
+    stmt = delete(Listing).where(Listing.id == id).returning(
+        Listing.id, Listing.owner_id, Listing.type, Listing.available_now,
+    )
     affected_row = await db.execute(stmt)
     affected_row = affected_row.first()
 
     if affected_row is not None:
-        return await transaction(f'Listing successully deleted: {affected_row}')
+        await apply_stats_deltas(
+            db, stats_deltas([(affected_row.type, affected_row.available_now, affected_row.owner_id, 1)], sign=-1),
+        )
+        response = await transaction(db, f'Listing successully deleted: {affected_row}')
+        if 'TransactionSuccess' in response:
+            address_index.remove(affected_row.id)
+            await listing_cache.invalidate(affected_row.id)
+            await bump_collection_version()
+        return response
     return {'NoListingsFoundError': 'No listing was found with this id'}
 
 
-async def delete_user_listings(owner_id: str) -> dict[str, dict[str, str] | str]:
-    """Delete all of the listings of a certain user by its id from the database."""
-    stmt = delete(Listing).where(Listing.owner_id == owner_id).returning(Listing.id, Listing.owner_id)
-    affected_row = await db.execute(stmt)
-    affected_row = affected_row.first()
+@traced
+async def delete_listings_chunk(db: AsyncSession, after: str | None, chunk_size: int, *criteria) -> list[str]:
+    """
+    Delete the next (at most `chunk_size`) listings matching `criteria` in primary-key order,
+    right after the `after` id, in one short transaction; returns the ids deleted.
+    """
+    chunk = select(Listing.id).where(*criteria).order_by(Listing.id).limit(chunk_size)
+    if after is not None:
+        chunk = chunk.where(Listing.id > after)
+    stmt = delete(Listing).where(Listing.id.in_(chunk.scalar_subquery())).returning(
+        Listing.id, Listing.owner_id, Listing.type, Listing.available_now,
+    )
+    affected_rows = await db.execute(stmt)
+    affected_rows = affected_rows.all()
+    if not affected_rows:
+        await db.rollback()
+        return []
 
-    if affected_row is not None:
-        return await transaction(f'All listings successully deleted')
-    return {'NoListingsFoundError': 'No listings exist for the user to be deleted'}
+    await apply_stats_deltas(
+        db, stats_deltas(((row.type, row.available_now, row.owner_id, 1) for row in affected_rows), sign=-1),
+    )
+    await db.commit()
 
+    listing_ids = [affected_row.id for affected_row in affected_rows]
+    for listing_id in listing_ids:
+        address_index.remove(listing_id)
+    await listing_cache.invalidate(*listing_ids)
+    await bump_collection_version()
+    return listing_ids
+
+
+@traced
+async def delete_listings_in_chunks(db: AsyncSession, job: Job, *criteria) -> None:
+    """
+    Delete every listing matching `criteria` chunk by chunk, pausing between the chunks so the
+    row locks, the WAL and the replicas keep up; the number of listings deleted is the job's `listings` progress.
+    """
+    after = None
+    job.progress.setdefault('listings', 0)
+    while listing_ids := await delete_listings_chunk(db, after, Config.DELETE_CHUNK_SIZE, *criteria):
+        job.progress['listings'] += len(listing_ids)
+        after = max(listing_ids)
+        await asyncio.sleep(Config.DELETE_CHUNK_PAUSE)
 
-async def delete_all_listings() -> dict[str, str]:
-    """Delete all of the listings inside the database."""
-    stmt = delete(Listing).returning(Listing.id, Listing.owner_id)
-    affected_row = await db.execute(stmt)
-    affected_row = affected_row.first()
 
-    if affected_row:
-        return await transaction(f'All listings successully deleted')
-    return {'NoListingsFoundError': 'No listings exist to be deleted'}
+@traced
+async def delete_user_listings_in_chunks(db: AsyncSession, job: Job, owner_id: str) -> None:
+    """Delete all of the listings of a certain user by its id, chunk by chunk."""
+    await delete_listings_in_chunks(db, job, Listing.owner_id == owner_id)
@@ -0,0 +1,117 @@
+from collections import Counter
+from typing import Iterable
+
+from sqlalchemy import delete, func, tuple_
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Listing, ListingStat
+from utils.query_log import traced
+
+
+def stats_deltas(listings: Iterable[tuple], sign: int = 1) -> Counter:
+    """
+    Function for turning `(type, available_now, owner_id, count)` tuples of added (`sign=1`)
+    or removed (`sign=-1`) listings into the changes of every counter they affect; there is no
+    `total` counter (every write would queue up on its single row), it is the sum of the `type` ones.
+    """
+    deltas = Counter()
+    for type, available_now, owner_id, count in listings:
+        count *= sign
+        deltas['type', getattr(type, 'value', type)] += count
+        deltas['available_now', str(bool(available_now)).lower()] += count
+        if owner_id is not None:
+            deltas['owner', owner_id] += count
+    return deltas
+
+
+@traced
+async def apply_stats_deltas(db: AsyncSession, deltas: Counter) -> None:
+    """
+    Apply counter changes inside the current transaction (committed along with the write
+    they belong to); the counters of owners left without listings are dropped.
+    """
+    deltas = {key: count for key, count in deltas.items() if count}
+    if not deltas:
+        return
+
+    stmt = insert(ListingStat).values([
+        {'dimension': dimension, 'key': key, 'count': count}
+        for (dimension, key), count in sorted(deltas.items())  # sorted, so concurrent writers lock rows in the same order
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ListingStat.dimension, ListingStat.key],
+        set_={'count': ListingStat.count + stmt.excluded.count},
+    )
+    await db.execute(stmt)
+
+    owners = [key for key in deltas if key[0] == 'owner']
+    if owners:
+        await db.execute(
+            delete(ListingStat)
+            .where(tuple_(ListingStat.dimension, ListingStat.key).in_(owners))
+            .where(ListingStat.count <= 0)
+        )
+
+
+@traced
+async def fetch_listing_stats(db: AsyncSession, top_owners: int, owner_id: str | None = None) -> dict:
+    """
+    Fetch the listing counters from the database, with the owners having the most
+    listings (or only `owner_id`); the cost does not depend on the number of listings.
+    """
+    query = select(ListingStat.dimension, ListingStat.key, ListingStat.count).where(
+        ListingStat.dimension.in_(['type', 'available_now'])
+    )
+    rows = await db.execute(query)
+
+    if owner_id is None:
+        owners_query = (
+            select(ListingStat.key, ListingStat.count)
+            .where(ListingStat.dimension == 'owner')
+            .order_by(ListingStat.count.desc(), ListingStat.key)
+            .limit(top_owners)
+        )
+    else:
+        owners_query = select(ListingStat.key, ListingStat.count).where(
+            ListingStat.dimension == 'owner', ListingStat.key == owner_id,
+        )
+    owners = await db.execute(owners_query)
+
+    stats = {'total': 0, 'by_type': {}, 'by_availability': {}}
+    for dimension, key, count in rows.all():
+        if dimension == 'type':
+            stats['by_type'][key] = count
+            stats['total'] += count
+        else:
+            stats['by_availability'][key] = count
+    stats['by_owner'] = [{'owner_id': key, 'count': count} for key, count in owners.all()]
+    return stats
+
+
+@traced
+async def reconcile_listing_stats(db: AsyncSession) -> int:
+    """
+    Recount every counter with `COUNT(*)` and fix the ones that drifted, returning how many did.
+
+    The listings and the counters are read from one snapshot, where they agree unless a counter
+    drifted (the counters are written in the same transactions as the listings), without locking
+    anything; the drift is then added to the counters, which commutes with the concurrent writes.
+    """
+    await db.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+    counted = await db.execute(
+        select(Listing.type, Listing.available_now, Listing.owner_id, func.count())
+        .group_by(Listing.type, Listing.available_now, Listing.owner_id)
+    )
+    actual = stats_deltas(counted.all())
+    stored = await db.execute(select(ListingStat.dimension, ListingStat.key, ListingStat.count))
+    stored = Counter({(dimension, key): count for dimension, key, count in stored.all()})
+
+    drift = Counter(actual)
+    drift.subtract(stored)
+    await db.commit()
+
+    await apply_stats_deltas(db, drift)
+    await db.commit()
+    return sum(1 for count in drift.values() if count)
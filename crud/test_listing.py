@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+import crud.listing
+from models import Listing
+from database import engine, async_session
+from crud.listing import copy_listings
+
+
+ADDRESS = 'Copy Rollback Test Street'
+
+
+def run(coroutine):
+    async def main():
+        try:
+            async with engine.connect():
+                pass
+        except Exception as error:
+            await engine.dispose()
+            pytest.skip(f'the database is unreachable: {error!r}')
+        try:
+            return await coroutine()
+        finally:
+            # the pooled connections belong to this event loop
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+def test_copy_listings_leaves_no_rows_when_the_stats_upsert_fails(monkeypatch):
+    async def failing_apply_stats_deltas(db, deltas):
+        raise RuntimeError('the stats upsert failed')
+
+    monkeypatch.setattr(crud.listing, 'apply_stats_deltas', failing_apply_stats_deltas)
+    current_time = datetime.utcnow()
+    listings = [
+        {
+            'type': 'HOUSE',
+            'available_now': True,
+            'owner_id': None,
+            'address': f'{ADDRESS} {index}',
+            'created_at': current_time,
+            'updated_at': current_time,
+        }
+        for index in range(3)
+    ]
+
+    async def copy_and_count():
+        async with async_session() as db:
+            response = await copy_listings(db, listings)
+        async with async_session() as db:
+            copied = await db.scalar(select(func.count()).where(Listing.address.startswith(ADDRESS)))
+        return response, copied
+
+    response, copied = run(copy_and_count)
+    assert 'TransactionError' in response
+    # the `COPY` ran inside the batch's transaction, so it was rolled back along with the failed upsert
+    assert copied == 0
@@ -1,86 +1,156 @@
+import asyncio
 from uuid import uuid4
 
 from sqlalchemy import insert, update, delete
 from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import Config
+from models import User, Listing
+from database import transaction
+from crud.stats import stats_deltas, apply_stats_deltas
+from crud.listing import delete_listings_in_chunks
+
+from utils.address_index import address_index
+from utils.cache import listing_cache
+from utils.etag import bump_collection_version
+from utils.jobs import Job
+from utils.query_log import traced
+from authentication.principal_caching import principal_cache
+
+
+# columns of a user as it is shown, fetched as plain rows instead of ORM objects (never the password)
+USER_COLUMNS = (
+    User.id,
+    User.username,
+    User.full_name,
+    User.email,
+    User.is_superuser,
+    User.date_of_birth,
+    User.gender,
+    User.created_at,
+    User.updated_at,
+)
+
+# columns of a user as it is embedded in the listings they own
+OWNER_COLUMNS = (
+    User.id,
+    User.username,
+    User.full_name,
+)
+
+
+@traced
+async def fetch_all_users(db: AsyncSession) -> list[dict]:
+    """Fetch all users from the database."""
+    query = select(*USER_COLUMNS)
+    users = await db.execute(query)
+    users = users.mappings().all()
+    return [dict(user) for user in users]
+
 
-from models import User
-from database import db, transaction
+@traced
+async def fetch_user_by_username(db: AsyncSession, username: str) -> dict:
+    """Fetch a certain user by their username from the database."""
+    query = select(*USER_COLUMNS).where(User.username == username)
+    user = await db.execute(query)
+    user = user.mappings().first()
+    if user:
+        return dict(user)
+    return {'NoUsersFoundError': 'No user was found with this username'}
 
-from utils.bulk_query_handler import bulk_query_to_dict
 
+@traced
+async def fetch_user_by_id(db: AsyncSession, id: str) -> dict:
+    """Fetch a certain user by their id from the database."""
+    query = select(*USER_COLUMNS).where(User.id == id)
+    user = await db.execute(query)
+    user = user.mappings().first()
+    if user:
+        return dict(user)
+    return {'NoUsersFoundError': 'No user was found with this id'}
 
-async def fetch_all_users() -> list[dict[str, str]]:
-    """Fetch all users from the database."""
-    query = select(User)
+
+@traced
+async def fetch_users_by_ids(db: AsyncSession, ids: list[str]) -> dict[str, dict]:
+    """Fetch the users of `ids` from the database with a single query, by their id."""
+    query = select(*OWNER_COLUMNS).where(User.id.in_(ids))
     users = await db.execute(query)
-    users = users.scalars().all()
-    if not users:
-        return [{'NoUsersFoundError': 'No users are registered'}]
-    return bulk_query_to_dict(users)
+    return {user['id']: dict(user) for user in users.mappings().all()}
 
 
-async def fetch_user_by_username(username: str) -> dict[str, str]:
-    """Fetch a certain user by their username from the database."""
-    query = select(User).where(User.username == username)
+@traced
+async def fetch_credentials_by_username(db: AsyncSession, username: str) -> dict[str, str]:
+    """Fetch the id and password hash of a certain user by their username from the database (for password checks)."""
+    query = select(User.id, User.password).where(User.username == username)
     user = await db.execute(query)
-    user = user.scalar()
+    user = user.mappings().first()
     if user:
-        user = user.__dict__
-        return user
+        return dict(user)
     return {'NoUsersFoundError': 'No user was found with this username'}
 
 
-async def fetch_user_by_id(id: str) -> dict[str, str]:
-    """Fetch a certain user by their id from the database."""
-    query = select(User).where(User.id == id)
+@traced
+async def fetch_credentials_by_id(db: AsyncSession, id: str) -> dict[str, str]:
+    """Fetch the id and password hash of a certain user by their id from the database (for password checks)."""
+    query = select(User.id, User.password).where(User.id == id)
     user = await db.execute(query)
-    user = user.scalar()
+    user = user.mappings().first()
     if user:
-        user = user.__dict__
-        return user
+        return dict(user)
     return {'NoUsersFoundError': 'No user was found with this id'}
 
 
-async def check_if_username_exists(username: str) -> bool:
+@traced
+async def check_if_username_exists(db: AsyncSession, username: str) -> bool:
     """Check if the username is already being used by another user inside the database."""
-    query = select(User).where(User.username == username)
+    query = select(User.id).where(User.username == username)
     user = await db.execute(query)
     if user.scalar() is not None:
         return True
     return False
 
 
-async def check_if_email_exists(email: str) -> bool:
+@traced
+async def check_if_email_exists(db: AsyncSession, email: str) -> bool:
     """Check if the email is already registered inside the database."""
-    query = select(User).where(User.email == email)
+    query = select(User.id).where(User.email == email)
     user = await db.execute(query)
     if user.scalar():
         return True
     return False
 
 
-async def insert_user(user: dict) -> dict[str, dict[str, str]]:
+@traced
+async def insert_user(db: AsyncSession, user: dict) -> dict[str, dict[str, str]]:
     """Insert a new user inside the database"""
     user.update({'id': uuid4().hex})  # first add a new random ID to the user values
     stmt = insert(User).values(**user)
     await db.execute(stmt)
 
     user.pop('password')  # remove the password data and do not show it
-    return await transaction(msg=f'User successfully registered: {user}')
+    return await transaction(db, msg=f'User successfully registered: {user}')
 
 
-async def bulk_insert_users(users: list[dict]) -> dict[str, str]:
-    """Insert a bulk of new users inside the database (for fake users generation)."""
+@traced
+async def bulk_insert_users(db: AsyncSession, users: list[dict]) -> tuple[dict[str, str], int]:
+    """
+    Insert a bulk of new users inside the database (for fake users generation),
+    the ones whose username or email is already taken are skipped; returns the number of users inserted too.
+    """
     for idx in range(len(users)):
         users[idx].update({'id': uuid4().hex})
-    stmt = insert(User).values(users)
-    await db.execute(stmt)
-    return await transaction(msg='New users were successfully registered.')
+    stmt = pg_insert(User).values(users).on_conflict_do_nothing().returning(User.id)
+    inserted = await db.execute(stmt)
+    inserted = len(inserted.all())
+    return await transaction(db, msg=f'{inserted} new users were successfully registered.'), inserted
 
 
-async def is_superuser_registered() -> bool:
+@traced
+async def is_superuser_registered(db: AsyncSession) -> bool:
     """Check if there exists at least one superuser inside the database."""
-    query = select(User).where(User.is_superuser == True)
+    query = select(User.id).where(User.is_superuser == True).limit(1)
     user = await db.execute(query)
     user = user.scalar()
     if user:
@@ -88,7 +158,8 @@ async def is_superuser_registered() -> bool:
     return False
 
 
-async def update_password(id: str, new_password: str) -> dict[str, str]:
+@traced
+async def update_password(db: AsyncSession, id: str, new_password: str) -> dict[str, str]:
     """Update the password of a certain user by their id inside the database."""
     stmt = (
         update(User)
@@ -98,10 +169,11 @@ async def update_password(id: str, new_password: str) -> dict[str, str]:
     )
 
     await db.execute(stmt)
-    return await transaction(msg='Password succesfully changed')
+    return await transaction(db, msg='Password succesfully changed')
 
 
-async def update_user(id: str, **kwargs) -> dict[str, str]:
+@traced
+async def update_user(db: AsyncSession, id: str, **kwargs) -> dict[str, str]:
     """Update a user by their id with new information inside the database."""
     stmt = (
         update(User)
@@ -111,26 +183,97 @@ async def update_user(id: str, **kwargs) -> dict[str, str]:
     )
 
     await db.execute(stmt)
-    return await transaction(msg='User successfully updated')
+    response = await transaction(db, msg='User successfully updated')
+    if 'TransactionSuccess' in response:
+        await principal_cache.invalidate(id)
+    return response
 
 
-async def delete_user(id: str) -> dict[str, dict[str, str] | str]:
+@traced
+async def delete_user(db: AsyncSession, id: str) -> dict[str, dict[str, str] | str]:
     """Delete a user by their id from the database."""
+    # the user is locked first, so no listing can be added for them until the commit
+    # (inserting one takes a key-share lock on the user), and the database cascade
+    # deletes exactly the listings (locked too) looked up here
+    await db.execute(select(User.id).where(User.id == id).with_for_update())
+    listings = await db.execute(
+        select(Listing.id, Listing.type, Listing.available_now, Listing.owner_id)
+        .where(Listing.owner_id == id)
+        .with_for_update()
+    )
+    listings = listings.all()
+    listing_ids = [listing.id for listing in listings]
+
     stmt = delete(User).where(User.id == id).returning(User.id, User.username)
     affected_row = await db.execute(stmt)
     affected_row = affected_row.first()
 
     if affected_row is not None:
-        return await transaction(f'User successully deleted: {affected_row}')
+        await apply_stats_deltas(db, stats_deltas(((*listing[1:], 1) for listing in listings), sign=-1))
+        response = await transaction(db, f'User successully deleted: {affected_row}')
+        if 'TransactionSuccess' in response:
+            await principal_cache.invalidate(id)
+            for listing_id in listing_ids:
+                address_index.remove(listing_id)
+            await listing_cache.invalidate(*listing_ids)
+            if listing_ids:
+                await bump_collection_version()
+        return response
     return {'NoUsersFoundError': 'No user was found with this id'}
 
 
-async def delete_all_users() -> dict[str, str]:
-    """Delete all of the registered users, except the `superusers`, from the database."""
-    stmt = delete(User).where(User.is_superuser == False).returning(User.id, User.username)
-    affected_row = await db.execute(stmt)
-    affected_row = affected_row.first()
-
-    if affected_row:
-        return await transaction(f'All users successully deleted')
-    return {'NoUsersFoundError': 'No user has been registered yet'}
+@traced
+async def delete_users_chunk(db: AsyncSession, after: str | None, chunk_size: int) -> list[str]:
+    """
+    Delete the next (at most `chunk_size`) users, except the `superusers`, in primary-key order,
+    right after the `after` id, in one short transaction; returns the ids deleted.
+    """
+    chunk = select(User.id).where(User.is_superuser == False).order_by(User.id).limit(chunk_size).with_for_update()
+    if after is not None:
+        chunk = chunk.where(User.id > after)
+
+    # the users of the chunk are fixed (and locked, so no listing can be added for them) before anything else
+    user_ids = await db.execute(chunk)
+    user_ids = user_ids.scalars().all()
+    if not user_ids:
+        await db.rollback()
+        return []
+
+    # the listings deleted by the database cascade (only the ones added since their chunks ran) are looked up beforehand
+    listings = await db.execute(
+        select(Listing.id, Listing.type, Listing.available_now, Listing.owner_id)
+        .where(Listing.owner_id.in_(user_ids))
+        .with_for_update()
+    )
+    listings = listings.all()
+
+    await db.execute(delete(User).where(User.id.in_(user_ids)))
+
+    await apply_stats_deltas(db, stats_deltas(((*listing[1:], 1) for listing in listings), sign=-1))
+    await db.commit()
+
+    await principal_cache.invalidate(None)
+    if listings:
+        for listing in listings:
+            address_index.remove(listing.id)
+        await listing_cache.invalidate(*(listing.id for listing in listings))
+        await bump_collection_version()
+    return user_ids
+
+
+@traced
+async def delete_all_users_in_chunks(db: AsyncSession, job: Job) -> None:
+    """
+    Delete every registered user, except the `superusers`, chunk by chunk: their listings
+    first (so no user deletion cascades over an unbounded number of listings), then the users;
+    the job's progress counts both the `listings` and the `users` deleted.
+    """
+    owned_by_users = Listing.owner_id.in_(select(User.id).where(User.is_superuser == False))
+    await delete_listings_in_chunks(db, job, owned_by_users)
+
+    after = None
+    job.progress.setdefault('users', 0)
+    while user_ids := await delete_users_chunk(db, after, Config.DELETE_CHUNK_SIZE):
+        job.progress['users'] += len(user_ids)
+        after = max(user_ids)
+        await asyncio.sleep(Config.DELETE_CHUNK_PAUSE)
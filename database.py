@@ -1,17 +1,198 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import os
+import time
+import asyncio
+from typing import AsyncIterator
+
+from sqlalchemy import text, Select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from config import Config
+from utils.metrics import db_pool_checkout_wait, instrument_engine
+from utils.query_log import slow_query_log
 
 
 # get the database url from config file
 DB_URL = Config.DB_URL
 
-# initialize the database, its Base `class`, and its SessionLocal `class`
+# initialize the database Base `class`
 Base = declarative_base()
 
 
-async def transaction(msg: str | None) -> dict[str, str]:
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Connection pool recording how long every checkout waits for a connection."""
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait.observe(time.perf_counter() - start)
+
+
+def build_engine(url: str) -> AsyncEngine:
+    """function for creating an engine with the pool settings of Config, with its statements timed and logged."""
+    engine = create_async_engine(
+        url,
+        future=True,
+        echo=False,  # turned off logging; set to True if you can't identify a problem
+        poolclass=TimedQueuePool,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_timeout=Config.DB_POOL_TIMEOUT,
+        pool_recycle=Config.DB_POOL_RECYCLE,
+        pool_pre_ping=Config.DB_POOL_PRE_PING,
+    )
+
+    # time every statement, for the `/metrics` endpoint
+    instrument_engine(engine.sync_engine)
+
+    # log the slow statements and the ones repeated within a request
+    slow_query_log.instrument(engine)
+    return engine
+
+
+# the main (primary) engine; its connection pool is shared by every request of this worker
+engine = build_engine(DB_URL)
+
+# the read-replica engines, one pool per replica
+replica_engines = [build_engine(url) for url in Config.DB_REPLICA_URLS]
+
+
+class ReplicaRouter:
+    """
+    Picks the replica a read-only session reads from, by round-robin or by the fewest
+    checked out connections (`'least_connections'`), among the healthy replicas only.
+
+    A background task checks every replica each `interval` seconds; a replica that
+    fails the check, or replays the primary's changes more than `max_lag` seconds
+    late, is left out until it passes again. Without a healthy replica the primary is used.
+    """
+    def __init__(self, engines: list[AsyncEngine], strategy: str, interval: float, timeout: float, max_lag: float):
+        self.engines = engines
+        self.healthy = list(engines)
+        self.strategy = strategy
+        self.interval = interval
+        self.timeout = timeout
+        self.max_lag = max_lag
+        self.turn = 0
+        self.task: asyncio.Task | None = None
+
+    def pick(self) -> AsyncEngine | None:
+        """Return the replica the next read-only session reads from, or `None` for the primary."""
+        healthy = self.healthy
+        if not healthy:
+            return None
+        if self.strategy == 'least_connections':
+            return min(healthy, key=lambda replica: replica.pool.checkedout())
+        self.turn = (self.turn + 1) % len(healthy)
+        return healthy[self.turn]
+
+    async def is_healthy(self, replica: AsyncEngine) -> bool:
+        """Check that a replica answers within `timeout` seconds and is not lagging behind."""
+        async def check() -> float:
+            async with replica.connect() as conn:
+                # no lag while every received change was replayed (or on a server that is no replica)
+                return await conn.scalar(text(
+                    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+                ))
+
+        try:
+            lag = await asyncio.wait_for(check(), timeout=self.timeout)
+        except Exception:
+            return False
+        return lag <= self.max_lag
+
+    async def check(self) -> None:
+        """Check every replica, keeping the healthy ones."""
+        results = await asyncio.gather(*(self.is_healthy(replica) for replica in self.engines))
+        healthy = [replica for replica, ok in zip(self.engines, results) if ok]
+        for replica in set(self.healthy) ^ set(healthy):
+            state = 'back' if replica in healthy else 'dropped'
+            print(f'[REPLICAS] {replica.url.render_as_string(hide_password=True)} {state}')
+        self.healthy = healthy
+
+    async def run(self) -> None:
+        """Check the replicas every `interval` seconds."""
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Start checking the replicas in the background."""
+        if self.engines:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop checking the replicas."""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+
+# routes the read-only sessions of this worker over the replicas
+replica_router = ReplicaRouter(
+    replica_engines,
+    strategy=Config.DB_REPLICA_ROUTING,
+    interval=Config.DB_REPLICA_HEALTH_CHECK_INTERVAL,
+    timeout=Config.DB_REPLICA_HEALTH_CHECK_TIMEOUT,
+    max_lag=Config.DB_REPLICA_MAX_LAG,
+)
+
+
+class RoutingSession(Session):
+    """
+    Session sending the plain `SELECT`s of a read-only session to its replica, and everything
+    else to the primary; once the primary was used, the session stays on it, so what a
+    request wrote (or locked) is read back from the primary.
+    """
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        replica = self.info.get('replica')
+        if replica is not None:
+            if isinstance(clause, Select) and clause._for_update_arg is None:
+                return replica.sync_engine
+            self.info['replica'] = None
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+# session factory, every request gets its own session out of it
+async_session = async_sessionmaker(
+    engine,
+    expire_on_commit=False,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+)
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """
+    dependency for handing each request its own database session,
+    the session (and its pooled connection) is released after the response.
+    """
+    async with async_session() as session:
+        yield session
+
+
+async def get_read_db() -> AsyncIterator[AsyncSession]:
+    """
+    dependency for handing a read-only request its own database session, reading from
+    a replica when one is healthy (anything but a plain `SELECT` still goes to the primary).
+    """
+    async with async_session(info={'replica': replica_router.pick()}) as session:
+        yield session
+
+
+def use_primary(db: AsyncSession) -> None:
+    """
+    function for sending the rest of a (read-only) session to the primary, for the reads
+    whose result outlives the request (cached rows, ETags) and so must not lag behind.
+    """
+    db.info['replica'] = None
+
+
+async def transaction(db: AsyncSession, msg: str | None) -> dict[str, str]:
     """
     boiler-plate transaction function, used in every `CRUD`
     operation after inserting/updating/deleting records.
@@ -24,27 +205,46 @@ async def transaction(msg: str | None) -> dict[str, str]:
         return {'TransactionError': 'Something went wrong / Reverting changes'}
 
 
-class AsyncDatabaseSession:
-    """class for handling/creating asynchronous database session"""
-    def __init__(self):
-        self.engine = create_async_engine(
-            DB_URL,
-            future=True,
-            echo=False,  # turned off logging; set to True if you can't identify a problem
-        )
-        self.session = sessionmaker(
-            self.engine,
-            expire_on_commit=False,
-            class_=AsyncSession,
-        )()
+async def create_all() -> None:
+    """function for creating every table that does not exist yet."""
+    async with engine.begin() as conn:
+        # the address trigram index needs the `pg_trgm` extension
+        await conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        await conn.run_sync(Base.metadata.create_all)
+
+
+def alembic_heads() -> set[str]:
+    """function for the head revisions of the alembic migrations."""
+    from alembic.config import Config as AlembicConfig
+    from alembic.script import ScriptDirectory
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    alembic_config = AlembicConfig(os.path.join(directory, 'alembic.ini'))
+    alembic_config.set_main_option('script_location', os.path.join(directory, 'migrations'))
+    return set(ScriptDirectory.from_config(alembic_config).get_heads())
+
+
+async def schema_is_at_head() -> bool:
+    """function for checking whether the database was migrated to the latest alembic revision."""
+    from alembic.runtime.migration import MigrationContext
+
+    async with engine.connect() as conn:
+        current = await conn.run_sync(lambda sync_conn: set(MigrationContext.configure(sync_conn).get_current_heads()))
+    return current == alembic_heads()
+
 
-    def __getattr__(self, name):
-        return getattr(self.session, name)
+async def warm_up(connections: int) -> None:
+    """function for opening `connections` pooled connections ahead of the first requests."""
+    async def connect():
+        async with engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
 
-    async def create_all(self):
-        async with self.engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+    # the connections are opened concurrently, so each of them is a new one
+    await asyncio.gather(*(connect() for _ in range(min(connections, Config.DB_POOL_SIZE))))
 
 
-# the main database variable used for all operations
-db = AsyncDatabaseSession()
+async def close() -> None:
+    """function for closing every pooled connection of the engines."""
+    await engine.dispose()
+    for replica in replica_engines:
+        await replica.dispose()
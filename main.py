@@ -1,25 +1,53 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from api.auth import auth
 from api.user import users
 from api.listing import listings
+from api.admin import admin
+from api.jobs import jobs as jobs_router
 
 from config import Config
-from database import db
+from database import async_session, create_all, schema_is_at_head, warm_up, replica_router, close
+from caching import warm_up as warm_up_redis, close as close_redis
 
 from crud.user import is_superuser_registered
+from crud.listing import fetch_listing_addresses
+from crud.stats import reconcile_listing_stats
 from utils.count import count_startup
-from utils.logging import log_request
+from utils.logging import log_request, access_log
 from utils.rate_limit import limit_requests
+from utils.metrics import measure_request, render_metrics, mark_worker_dead
+from utils.query_log import track_queries, slow_query_log
 from utils.fake_generator import generate_fake_users
 from utils.superuser_generator import create_superuser
+from utils.address_index import address_index
+from utils.cache import listing_cache
+from utils.stats import stats_reconciler
+from utils.startup import StartupTimer
+from utils.jobs import jobs
+from authentication.password_handler import shutdown_executor
+from authentication.principal_caching import principal_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Lifespan handler, running the startup actions before the first request and the shutdown actions after the last."""
+    await startup()
+    yield
+    await shutdown()
 
 
 app = FastAPI(
     title='Dornica Real Estate API',
     description='A Real Estate app as an assessment test for back-end role at Dornica.',
     version='1.0',
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,  # responses are serialized by `orjson`
 )
 
 # adding middlewares
@@ -44,6 +72,20 @@ async def log_middleware(request: Request, call_next) -> None:
     return await log_request(request, call_next)
 
 
+# adding metrics middleware
+@app.middleware('http')
+async def metrics_middleware(request: Request, call_next) -> None:
+    """auxilliary function for calling the main metrics function"""
+    return await measure_request(request, call_next)
+
+
+# adding query tracking middleware
+@app.middleware('http')
+async def query_middleware(request: Request, call_next) -> None:
+    """auxilliary function for calling the main query tracking function"""
+    return await track_queries(request, call_next)
+
+
 # adding authentication rate-limit middleware
 @app.middleware('http')
 async def ratelimit_middleware(request: Request, call_next) -> None:
@@ -51,26 +93,113 @@ async def ratelimit_middleware(request: Request, call_next) -> None:
     return await limit_requests(request, call_next)
 
 
-@app.on_event('startup')
+async def load_listing_addresses() -> list[tuple[str, str]]:
+    """auxilliary function for loading every listing address with a short-lived session"""
+    async with async_session() as db:
+        return await fetch_listing_addresses(db)
+
+
+async def reconcile_stats() -> int:
+    """auxilliary function for reconciling the listing statistics with a short-lived session"""
+    async with async_session() as db:
+        return await reconcile_listing_stats(db)
+
+
+async def warm_up_pools(connections: int) -> None:
+    """auxilliary function for opening `connections` pooled database and Redis connections, a failure is only logged"""
+    results = await asyncio.gather(warm_up(connections), warm_up_redis(connections), return_exceptions=True)
+    for pool, result in zip(('database', 'Redis'), results):
+        # the pools open their connections on demand anyway (and Redis errors are soft failures everywhere)
+        if isinstance(result, Exception):
+            print(f'[STARTUP] warming up the {pool} pool failed: {result!r}')
+
+
+async def seed_fake_users(n: int) -> None:
+    """auxilliary function for inserting `n` fake users with a short-lived session"""
+    try:
+        async with async_session() as db:
+            response = await generate_fake_users(db, n=n)
+        print(f'[SEEDING] {response["RandomUsersGenerated"]}')
+    except Exception as error:
+        print(f'[SEEDING] inserting the fake users failed: {error!r}')
+
+
+# the background tasks started by `startup`, awaited (or cancelled) by `shutdown`
+background_tasks: set[asyncio.Task] = set()
+
+
 async def startup():
     """Startup function for specifying the actions done at the application startup."""
+    timer = StartupTimer()
+
     # count the startup
-    count_startup()
-    await db.create_all()
+    with timer.step('count_startup'):
+        count_startup()
+
+    # write the buffered access log lines in batches
+    access_log.start()
+    slow_query_log.start()
+
+    # open some pooled connections now, rather than on the first requests
+    with timer.step('warm_up_pools'):
+        await warm_up_pools(Config.POOL_WARM_UP_CONNECTIONS)
+
+    # the tables are created here only when the database was not migrated with alembic
+    with timer.step('create_all'):
+        if not await schema_is_at_head():
+            await create_all()
+
+    with timer.step('superuser'):
+        async with async_session() as db:
+            # create superuser
+            if await is_superuser_registered(db) is not True:
+                await create_superuser(db)
+                print('[SUPERUSER] The superuser was successfully created')
 
-    # create superuser
-    if await is_superuser_registered() is not True:
-        await create_superuser()
-        print('[SUPERUSER] The superuser was successfully created')
-    
-    # create 3 random users
-    await generate_fake_users(n=3)
+    # insert fake users in the background, only when asked to
+    if Config.SEED_FAKE_USERS > 0:
+        task = asyncio.create_task(seed_fake_users(Config.SEED_FAKE_USERS))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+    # run the queued background jobs, a few at a time
+    jobs.start()
+
+    # route the read-only sessions over the healthy replicas, if any
+    replica_router.start()
+
+    # drop the locally cached listings and principals invalidated by other workers
+    listing_cache.start()
+    principal_cache.start()
+
+    # recount the listing statistics now and then, fixing any drift of their counters
+    stats_reconciler.start(reconcile_stats, Config.STATS_RECONCILE_INTERVAL)
+
+    # build the in-process address index, used for the address autocomplete
+    if Config.ADDRESS_INDEX_ENABLED:
+        with timer.step('address_index'):
+            await address_index.start(load_listing_addresses, Config.ADDRESS_INDEX_REFRESH)
+
+    print(timer.report())
 
 
-@app.on_event('shutdown')
 async def shutdown():
     """Shutdown function for specifying the actions done at the application shutdown."""
-    await db.close()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await jobs.stop()
+    await address_index.stop()
+    await replica_router.stop()
+    await stats_reconciler.stop()
+    await listing_cache.stop()
+    await principal_cache.stop()
+    await access_log.stop()
+    await slow_query_log.stop()
+    await close()
+    await close_redis()
+    shutdown_executor()
+    mark_worker_dead()
 
 
 @app.get('/', tags=['Homepage'])
@@ -79,7 +208,15 @@ async def homepage():
     return {'Message': 'Welcome to the homepage'}
 
 
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    """Metrics endpoint, in the Prometheus text format (summed up over every worker)."""
+    return render_metrics()
+
+
 # adding the API routes specified inside the `api` folder
 app.include_router(auth, prefix=Config.API_PREFIX)
 app.include_router(users, prefix=Config.API_PREFIX)
 app.include_router(listings, prefix=Config.API_PREFIX)
+app.include_router(jobs_router, prefix=Config.API_PREFIX)
+app.include_router(admin, prefix=Config.API_PREFIX)
@@ -0,0 +1,32 @@
+"""add listings keyset indexes
+
+Revision ID: 6bbf45294f0f
+Revises: 77b4d876bdb7
+Create Date: 2026-10-18 13:25:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = '6bbf45294f0f'
+down_revision = '77b4d876bdb7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # databases bootstrapped by `Base.metadata.create_all` may already have these indexes
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('listings')}
+
+    if 'ix_listings_created_at_id' not in existing:
+        op.create_index('ix_listings_created_at_id', 'listings', ['created_at', 'id'], unique=False)
+    if 'ix_listings_owner_id_created_at_id' not in existing:
+        op.create_index('ix_listings_owner_id_created_at_id', 'listings', ['owner_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_listings_owner_id_created_at_id', table_name='listings')
+    op.drop_index('ix_listings_created_at_id', table_name='listings')
@@ -0,0 +1,69 @@
+"""initial schema
+
+Revision ID: 77b4d876bdb7
+Revises: 
+Create Date: 2026-10-18 13:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = '77b4d876bdb7'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # databases bootstrapped by `Base.metadata.create_all` already have these tables
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('users'):
+        op.create_table(
+            'users',
+            sa.Column('id', sa.String(length=32), nullable=False),
+            sa.Column('username', sa.String(length=24), nullable=False),
+            sa.Column('full_name', sa.String(length=30), nullable=True),
+            sa.Column('email', sqlalchemy_utils.types.email.EmailType(length=255), nullable=False),
+            sa.Column('password', sa.String(length=64), nullable=False),
+            sa.Column('is_superuser', sa.Boolean(), nullable=False),
+            sa.Column('date_of_birth', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('gender', sa.Enum('MALE', 'FEMALE', 'NOT_SPECIFIED', name='gender_types'), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+        op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+        op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
+
+    if not inspector.has_table('listings'):
+        op.create_table(
+            'listings',
+            sa.Column('id', sa.String(length=32), nullable=False),
+            sa.Column('type', sa.Enum('HOUSE', 'APARTMENT', name='listing_types'), nullable=False),
+            sa.Column('available_now', sa.Boolean(), nullable=True),
+            sa.Column('owner_id', sa.String(length=32), nullable=True),
+            sa.Column('address', sa.String(length=255), nullable=False),
+            sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+            sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(op.f('ix_listings_id'), 'listings', ['id'], unique=False)
+        op.create_index(op.f('ix_listings_owner_id'), 'listings', ['owner_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_listings_owner_id'), table_name='listings')
+    op.drop_index(op.f('ix_listings_id'), table_name='listings')
+    op.drop_table('listings')
+    op.drop_index(op.f('ix_users_username'), table_name='users')
+    op.drop_index(op.f('ix_users_id'), table_name='users')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_table('users')
+    sa.Enum(name='listing_types').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='gender_types').drop(op.get_bind(), checkfirst=True)
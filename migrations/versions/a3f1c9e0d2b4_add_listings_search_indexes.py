@@ -0,0 +1,38 @@
+"""add listings search indexes
+
+Revision ID: a3f1c9e0d2b4
+Revises: 6bbf45294f0f
+Create Date: 2026-10-18 13:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9e0d2b4'
+down_revision = '6bbf45294f0f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # databases bootstrapped by `Base.metadata.create_all` may already have these indexes
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('listings')}
+
+    if 'ix_listings_updated_at_id' not in existing:
+        op.create_index('ix_listings_updated_at_id', 'listings', ['updated_at', 'id'], unique=False)
+    if 'ix_listings_type_created_at_id' not in existing:
+        op.create_index('ix_listings_type_created_at_id', 'listings', ['type', 'created_at', 'id'], unique=False)
+    if 'ix_listings_available_type_created_at_id' not in existing:
+        op.create_index(
+            'ix_listings_available_type_created_at_id', 'listings', ['type', 'created_at', 'id'],
+            unique=False, postgresql_where=sa.text('available_now = true'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_listings_available_type_created_at_id', table_name='listings')
+    op.drop_index('ix_listings_type_created_at_id', table_name='listings')
+    op.drop_index('ix_listings_updated_at_id', table_name='listings')
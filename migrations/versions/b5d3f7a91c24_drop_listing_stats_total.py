@@ -0,0 +1,31 @@
+"""drop listing stats total
+
+Revision ID: b5d3f7a91c24
+Revises: e41b7c2d9a63
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d3f7a91c24'
+down_revision = 'e41b7c2d9a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the total is the sum of the `type` counters from now on, its single row was contended by every write
+    op.execute("DELETE FROM listing_stats WHERE dimension = 'total'")
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        INSERT INTO listing_stats (dimension, key, count)
+        SELECT 'total', '', count(*) FROM listings
+        """
+    )
@@ -0,0 +1,33 @@
+"""add listings address trigram index
+
+Revision ID: c7d2e8a41f90
+Revises: a3f1c9e0d2b4
+Create Date: 2026-10-18 13:55:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e8a41f90'
+down_revision = 'a3f1c9e0d2b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # databases bootstrapped by `Base.metadata.create_all` may already have this index
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('listings')}
+    if 'ix_listings_address_trgm' not in existing:
+        op.create_index(
+            'ix_listings_address_trgm', 'listings', ['address'], unique=False,
+            postgresql_using='gin', postgresql_ops={'address': 'gin_trgm_ops'},
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_listings_address_trgm', table_name='listings')
@@ -0,0 +1,51 @@
+"""add listing stats
+
+Revision ID: e41b7c2d9a63
+Revises: c7d2e8a41f90
+Create Date: 2026-10-18 14:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41b7c2d9a63'
+down_revision = 'c7d2e8a41f90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # databases bootstrapped by `Base.metadata.create_all` may already have this table
+    if not sa.inspect(op.get_bind()).has_table('listing_stats'):
+        op.create_table(
+            'listing_stats',
+            sa.Column('dimension', sa.String(length=16), nullable=False),
+            sa.Column('key', sa.String(length=32), nullable=False),
+            sa.Column('count', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('dimension', 'key'),
+        )
+        op.create_index('ix_listing_stats_dimension_count', 'listing_stats', ['dimension', 'count'], unique=False)
+
+    # count the existing listings, the counters are maintained incrementally from now on
+    op.execute('DELETE FROM listing_stats')
+    op.execute(
+        """
+        INSERT INTO listing_stats (dimension, key, count)
+        SELECT 'total', '', count(*) FROM listings
+        UNION ALL
+        SELECT 'type', type::text, count(*) FROM listings GROUP BY type
+        UNION ALL
+        SELECT 'available_now', CASE WHEN available_now THEN 'true' ELSE 'false' END, count(*)
+        FROM listings GROUP BY 2
+        UNION ALL
+        SELECT 'owner', owner_id, count(*) FROM listings WHERE owner_id IS NOT NULL GROUP BY owner_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_listing_stats_dimension_count', table_name='listing_stats')
+    op.drop_table('listing_stats')
@@ -1,8 +1,8 @@
 from datetime import datetime
 
 from sqlalchemy import (
-    Column, ForeignKey, Boolean,
-    Enum, String, DateTime,
+    Column, ForeignKey, Boolean, BigInteger,
+    Enum, String, DateTime, Index, text,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy_utils import EmailType
@@ -44,3 +44,38 @@ class Listing(Base):
 
     # one-to-many relationship
     owner = relationship('User', back_populates='listings')
+
+    # composite indexes backing the keyset pagination and the search sort orders
+    __table_args__ = (
+        Index('ix_listings_created_at_id', 'created_at', 'id'),
+        Index('ix_listings_owner_id_created_at_id', 'owner_id', 'created_at', 'id'),
+        Index('ix_listings_updated_at_id', 'updated_at', 'id'),
+        Index('ix_listings_type_created_at_id', 'type', 'created_at', 'id'),
+        Index(
+            'ix_listings_available_type_created_at_id', 'type', 'created_at', 'id',
+            postgresql_where=text('available_now = true'),
+        ),
+        # trigram index backing the substring, prefix and typo-tolerant address search
+        Index(
+            'ix_listings_address_trgm', 'address',
+            postgresql_using='gin', postgresql_ops={'address': 'gin_trgm_ops'},
+        ),
+    )
+
+
+class ListingStat(Base):
+    """
+    Model class for SQLAlchemy interpretation of a listing counter, kept up to date by the listing
+    `CRUD` functions in the same transaction as their writes; `dimension` is one of `type`,
+    `available_now` or `owner`, and `key` the value counted (the total is the sum of the `type` counters).
+    """
+    __tablename__ = 'listing_stats'
+
+    dimension = Column(String(16), primary_key=True)
+    key = Column(String(32), primary_key=True)
+    count = Column(BigInteger, default=0, nullable=False)
+
+    # backing the owners with the most listings
+    __table_args__ = (
+        Index('ix_listing_stats_dimension_count', 'dimension', 'count'),
+    )
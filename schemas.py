@@ -17,6 +17,24 @@ class Listing(str, Enum):
     APARTMENT = 'APARTMENT'
 
 
+class ListingSort(str, Enum):
+    """Enum class to enforce usage of pre-defined values for the listing search `sort` field."""
+    NEWEST = 'NEWEST'
+    OLDEST = 'OLDEST'
+    RECENTLY_UPDATED = 'RECENTLY_UPDATED'
+
+
+class ListingExpand(str, Enum):
+    """Enum class to enforce usage of pre-defined values for the nested fields of the listing `expand` field."""
+    OWNER = 'owner'
+
+
+class ExportFormat(str, Enum):
+    """Enum class to enforce usage of pre-defined values for the listing export `format` field."""
+    NDJSON = 'NDJSON'
+    CSV = 'CSV'
+
+
 class UserSignup(BaseModel):
     """Class for validating user sign-up data."""
     username: str
@@ -58,6 +76,12 @@ class UserLogin(BaseModel):
     password: str
 
 
+class Principal(BaseModel):
+    """Class for holding the identity of the authenticated user of a request."""
+    id: str
+    is_superuser: bool = False
+
+
 class UserUpdate(BaseModel):
     """Class for validating the insertion of a users's updated data."""
     username: str | None = None
@@ -80,7 +104,7 @@ class ListingAdd(BaseModel):
     """Class for validating the insertion of a listing's data."""
     type: Listing
     available_now: bool = True
-    address: str
+    address: str = Field(..., max_length=255)
 
 
 class ListingUpdate(BaseModel):
@@ -88,6 +112,13 @@ class ListingUpdate(BaseModel):
     available_now: bool = True
 
 
+class ListingOwner(BaseModel):
+    """Class for showing the owner embedded in a listing."""
+    id: str
+    username: str
+    full_name: str | None = None
+
+
 class ListingView(ListingAdd):
     """
     Class for showing a listing,
@@ -96,3 +127,65 @@ class ListingView(ListingAdd):
     id: str
     created_at: datetime
     updated_at: datetime
+    owner: ListingOwner | None = None  # only with `expand=owner`
+
+
+class ListingPage(BaseModel):
+    """Class for showing a page of listings along with the cursor of the next page."""
+    items: list[ListingView]
+    next_cursor: str | None = None
+
+
+class OwnerListingCount(BaseModel):
+    """Class for showing the number of listings of an owner."""
+    owner_id: str
+    count: int
+
+
+class ListingStatsView(BaseModel):
+    """Class for showing the listing counters, in total, by type, by availability and by owner."""
+    total: int
+    by_type: dict[str, int]
+    by_availability: dict[str, int]
+    by_owner: list[OwnerListingCount]
+
+
+class ImportRowError(BaseModel):
+    """Class for showing why a row (by its line number) of an imported file was not loaded."""
+    row: int
+    error: str
+
+
+class ListingImportReport(BaseModel):
+    """Class for showing the outcome of a bulk listing import."""
+    imported: int
+    failed: int
+    errors: list[ImportRowError]
+    elapsed_seconds: float
+    rows_per_second: float
+
+
+class JobView(BaseModel):
+    """Class for showing a background job and its progress."""
+    id: str
+    name: str
+    status: str
+    progress: dict[str, int]
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+
+class AddressMatch(ListingView):
+    """
+    Class for showing a listing found by the address search,
+    inherits from `ListingView`.
+    """
+    score: float
+
+
+class AddressSuggestion(BaseModel):
+    """Class for showing an address suggested by the autocomplete."""
+    id: str
+    address: str
@@ -0,0 +1,169 @@
+import re
+import heapq
+import bisect
+import asyncio
+from collections import Counter
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> list[str]:
+    """Function for splitting an address into lower-cased word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class AddressIndex:
+    """
+    In-process inverted index of listing addresses, used for sub-millisecond autocomplete.
+
+    Every worker keeps its own copy; it is updated by the listing `CRUD` functions of
+    the same worker and rebuilt periodically to pick up changes made by other workers.
+    A rebuild runs in a thread, off the event loop; the changes made meanwhile are
+    replayed onto the new index once it is swapped in.
+    """
+    def __init__(self):
+        self.ready = False
+        self.addresses: dict[str, str] = {}
+        self.postings: dict[str, set[str]] = {}
+        self.sorted_tokens: list[str] = []
+        self.dirty = False
+        self.changes: list[tuple[str, str | None]] | None = None  # recorded while a rebuild runs
+        self.refresh_task: asyncio.Task | None = None
+
+    @staticmethod
+    def structures(rows) -> tuple[dict[str, str], dict[str, set[str]], list[str]]:
+        """Build the addresses, postings and sorted tokens of the given `(id, address)` rows."""
+        addresses, postings = {}, {}
+        for id, address in rows:
+            addresses[id] = address
+            for token in set(tokenize(address)):
+                postings.setdefault(token, set()).add(id)
+        return addresses, postings, sorted(postings)
+
+    def swap(self, addresses: dict[str, str], postings: dict[str, set[str]], sorted_tokens: list[str]) -> None:
+        """Replace the whole index in one go, readers never see a half-built index."""
+        self.addresses, self.postings, self.sorted_tokens = addresses, postings, sorted_tokens
+        self.dirty = False
+        self.ready = True
+
+    def build(self, rows) -> None:
+        """Replace the whole index with the given `(id, address)` rows."""
+        self.swap(*self.structures(rows))
+
+    async def rebuild(self, load) -> None:
+        """Replace the whole index with the rows returned by the `load` coroutine, built in a thread."""
+        self.changes = []
+        try:
+            rows = await load()
+            structures = await asyncio.to_thread(self.structures, rows)
+            changes = self.changes
+            self.changes = None
+            self.swap(*structures)
+            # the listings added or removed by this worker while the index was rebuilt
+            for id, address in changes:
+                if address is None:
+                    self.remove(id)
+                else:
+                    self.add(id, address)
+        finally:
+            self.changes = None
+
+    def add(self, id: str, address: str) -> None:
+        """Add (or replace) the address of a listing."""
+        if self.changes is not None:
+            self.changes.append((id, address))
+        if not self.ready:
+            return
+        self.drop(id)
+        self.addresses[id] = address
+        for token in set(tokenize(address)):
+            if token not in self.postings:
+                self.postings[token] = set()
+                self.dirty = True
+            self.postings[token].add(id)
+
+    def remove(self, id: str) -> None:
+        """Remove the address of a listing, if it is indexed."""
+        if self.changes is not None:
+            self.changes.append((id, None))
+        self.drop(id)
+
+    def drop(self, id: str) -> None:
+        """Drop the address of a listing from the current index (without recording the change)."""
+        address = self.addresses.pop(id, None) if self.ready else None
+        if address is None:
+            return
+        for token in set(tokenize(address)):
+            ids = self.postings.get(token)
+            if ids is not None:
+                ids.discard(id)
+                if not ids:
+                    del self.postings[token]
+                    self.dirty = True
+
+    def clear(self) -> None:
+        """Remove every indexed address."""
+        if self.ready:
+            self.build([])
+
+    def expand(self, prefix: str) -> list[str]:
+        """Find every indexed token starting with `prefix`."""
+        if self.dirty:
+            self.sorted_tokens = sorted(self.postings)
+            self.dirty = False
+        start = bisect.bisect_left(self.sorted_tokens, prefix)
+        end = bisect.bisect_left(self.sorted_tokens, prefix + '\uffff')
+        return self.sorted_tokens[start:end]
+
+    def search(self, query: str, limit: int) -> list[dict[str, str]]:
+        """
+        Find the addresses whose tokens start with every token of the query,
+        ranked by the number of exactly matching tokens and then by the address length.
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        candidates, exact_matches = None, Counter()
+        for token in query_tokens:
+            matches = set()
+            for expanded in self.expand(token):
+                matches |= self.postings[expanded]
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return []
+            for id in self.postings.get(token, ()):
+                exact_matches[id] += 1
+
+        ranked = heapq.nsmallest(
+            limit,
+            candidates,
+            key=lambda id: (-exact_matches[id], len(self.addresses[id]), self.addresses[id]),
+        )
+        return [{'id': id, 'address': self.addresses[id]} for id in ranked]
+
+    async def refresh(self, load, interval: int) -> None:
+        """Rebuild the index out of the rows returned by the `load` coroutine every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.rebuild(load)
+            except Exception as error:
+                print(f'[ADDRESS INDEX] refresh failed, keeping the previous index: {error!r}')
+
+    async def start(self, load, interval: int) -> None:
+        """Build the index and start refreshing it in the background."""
+        await self.rebuild(load)
+        self.refresh_task = asyncio.create_task(self.refresh(load, interval))
+
+    async def stop(self) -> None:
+        """Stop refreshing the index."""
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+            await asyncio.gather(self.refresh_task, return_exceptions=True)
+            self.refresh_task = None
+
+
+# the address index of this worker, only built when `Config.ADDRESS_INDEX_ENABLED` is set
+address_index = AddressIndex()
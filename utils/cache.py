@@ -0,0 +1,284 @@
+import json
+import time
+import asyncio
+from datetime import datetime
+from collections import OrderedDict
+
+from redis.exceptions import RedisError
+
+from config import Config
+from caching import redis_client
+
+
+# caches an entry only while its generation (and the one of the whole cache) is still the one read before it was loaded
+SET_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') .. ':' .. (redis.call('GET', KEYS[3]) or '0') == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+set_if_generation = redis_client.register_script(SET_IF_GENERATION_SCRIPT)
+
+
+def to_json(value) -> str:
+    """Function for encoding a cached value, datetimes are stored in ISO 8601 format."""
+    return json.dumps(value, default=lambda item: item.isoformat() if isinstance(item, datetime) else str(item))
+
+
+async def listen_for_invalidations(channel: str, on_message, on_disconnect) -> None:
+    """
+    Function for calling `on_message` with every (JSON decoded) invalidation published on
+    `channel` as long as the app runs; `on_disconnect` is called whenever the subscription
+    is lost, as invalidations may have been missed meanwhile.
+    """
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(channel)
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        on_message(json.loads(message['data']))
+        except RedisError:
+            on_disconnect()
+            await asyncio.sleep(1)
+
+
+class LRUCache:
+    """In-process least-recently-used cache whose entries also expire after `ttl` seconds."""
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str):
+        """Return the cached value of `key`, or `None` if it is missing or expired."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value, ttl: float | None = None) -> None:
+        """Cache `value` under `key` (for `ttl` seconds, the cache's by default), evicting the least recently used entry when full."""
+        self.entries[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: str) -> None:
+        """Drop `key` from the cache."""
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry of the cache."""
+        self.entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters of the cache."""
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class TieredCache:
+    """
+    Read-through cache with an in-process `LRUCache` tier in front of a shared Redis tier.
+
+    Invalidations are published on a Redis channel, so every worker listening to it
+    drops its local copy too; Redis errors are treated as cache misses.
+
+    Every invalidation bumps the generation of its keys (and of the local tier), so a value
+    loaded before an invalidation but cached after it (with the `generation` read before
+    loading it) is dropped instead of being cached again for the whole TTL.
+    """
+    def __init__(self, name: str, maxsize: int, local_ttl: float, redis_ttl: int):
+        self.name = name
+        self.local = LRUCache(maxsize, local_ttl)
+        self.redis_ttl = redis_ttl
+        self.channel = f'cache_invalidation:{name}'
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+        self.stale_sets = 0
+        self.local_generation = 0  # bumped by every invalidation this worker sees
+        self.listener: asyncio.Task | None = None
+
+    def redis_key(self, key: str) -> str:
+        """Return the Redis key an entry is stored under."""
+        return f'cache:{self.name}:{key}'
+
+    def generation_key(self, key: str | None = None) -> str:
+        """Return the Redis key the generation of an entry (or of the whole cache) is stored under."""
+        # kept out of the `cache:` keys, so `clear` does not reset them
+        return f'cache_generation:{self.name}:{key}' if key is not None else f'cache_generation:{self.name}'
+
+    async def get(self, key: str):
+        """Return the cached value of `key` from the first tier having it, or `None`."""
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        local_generation = self.local_generation
+        try:
+            raw = await redis_client.get(self.redis_key(key))
+        except RedisError:
+            self.redis_errors += 1
+            return None
+
+        if raw is None:
+            self.redis_misses += 1
+            return None
+
+        self.redis_hits += 1
+        value = json.loads(raw)
+        if local_generation == self.local_generation:
+            self.local.set(key, value)
+        return value
+
+    async def generation(self, key: str) -> tuple[int, str | None]:
+        """Return the generation of `key`, to be read before loading the value to cache."""
+        local_generation = self.local_generation
+        try:
+            generations = await redis_client.mget(self.generation_key(key), self.generation_key())
+        except RedisError:
+            self.redis_errors += 1
+            return local_generation, None
+        return local_generation, ':'.join(item.decode() if item is not None else '0' for item in generations)
+
+    async def set(self, key: str, value, generation: tuple[int, str | None] | None = None) -> None:
+        """Cache `value` under `key` in both tiers, unless `key` was invalidated since its `generation` was read."""
+        if generation is None:
+            self.local.set(key, value)
+            try:
+                await redis_client.set(self.redis_key(key), to_json(value), ex=self.redis_ttl)
+            except RedisError:
+                self.redis_errors += 1
+            return
+
+        local_generation, redis_generation = generation
+        if local_generation != self.local_generation:
+            self.stale_sets += 1
+            return
+        if redis_generation is not None:
+            try:
+                stored = await set_if_generation(
+                    keys=[self.redis_key(key), self.generation_key(key), self.generation_key()],
+                    args=[redis_generation, to_json(value), self.redis_ttl],
+                )
+            except RedisError:
+                self.redis_errors += 1
+            else:
+                if not stored:
+                    self.stale_sets += 1
+                    return
+        # the local tier is checked again, an invalidation may have come in meanwhile
+        if local_generation == self.local_generation:
+            self.local.set(key, value)
+
+    async def invalidate(self, *keys: str) -> None:
+        """Drop `keys` from both tiers, on every worker."""
+        if not keys:
+            return
+        self.local_generation += 1
+        for key in keys:
+            self.local.pop(key)
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.unlink(*(self.redis_key(key) for key in keys))
+                for key in keys:
+                    # the generation outlives any load that could have started before it was bumped
+                    pipe.incr(self.generation_key(key))
+                    pipe.expire(self.generation_key(key), self.redis_ttl)
+                await pipe.execute()
+            await redis_client.publish(self.channel, json.dumps(keys))
+        except RedisError:
+            self.redis_errors += 1
+
+    async def clear(self) -> None:
+        """Drop every entry from both tiers, on every worker."""
+        self.local_generation += 1
+        self.local.clear()
+        try:
+            await redis_client.incr(self.generation_key())
+            batch = []
+            async for redis_key in redis_client.scan_iter(match=self.redis_key('*'), count=1000):
+                batch.append(redis_key)
+                if len(batch) >= 1000:
+                    await redis_client.unlink(*batch)
+                    batch = []
+            if batch:
+                await redis_client.unlink(*batch)
+            await redis_client.publish(self.channel, json.dumps('*'))
+        except RedisError:
+            self.redis_errors += 1
+
+    def drop_local(self, keys: list[str] | str) -> None:
+        """Drop the local entries invalidated by another worker (`'*'` drops them all)."""
+        self.local_generation += 1
+        if keys == '*':
+            self.local.clear()
+        else:
+            for key in keys:
+                self.local.pop(key)
+
+    def drop_all_local(self) -> None:
+        """Drop every local entry, as invalidations may have been missed while disconnected."""
+        self.redis_errors += 1
+        self.local_generation += 1
+        self.local.clear()
+
+    def start(self) -> None:
+        """Start listening to the invalidations of other workers in the background."""
+        self.listener = asyncio.create_task(
+            listen_for_invalidations(self.channel, self.drop_local, self.drop_all_local)
+        )
+
+    async def stop(self) -> None:
+        """Stop listening to the invalidations of other workers."""
+        if self.listener is not None:
+            self.listener.cancel()
+            await asyncio.gather(self.listener, return_exceptions=True)
+            self.listener = None
+
+    def stats(self) -> dict[str, dict[str, int] | int]:
+        """Return the counters of both tiers."""
+        return {
+            'local': self.local.stats(),
+            'redis': {
+                'hits': self.redis_hits,
+                'misses': self.redis_misses,
+                'errors': self.redis_errors,
+            },
+            'stale_sets': self.stale_sets,
+        }
+
+
+# read-through cache of single listings, filled by `fetch_listing_by_id`
+listing_cache = TieredCache(
+    'listings',
+    maxsize=Config.LISTING_CACHE_SIZE,
+    local_ttl=Config.LISTING_CACHE_LOCAL_TTL,
+    redis_ttl=Config.LISTING_CACHE_TTL,
+)
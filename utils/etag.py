@@ -0,0 +1,80 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Response
+from redis.exceptions import RedisError
+
+from caching import redis_client
+
+
+# version of the listing collection, bumped by every listing write
+COLLECTION_VERSION_KEY = 'listings_version'
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def version_seed() -> int:
+    """
+    Function for the first value of the collection version; a counter lost along with
+    Redis restarts from the current time, so it never reuses a version handed out before.
+    """
+    return time.time_ns() // 1000
+
+
+async def get_collection_version() -> int | None:
+    """Function for reading the version of the listing collection, `None` while Redis is unreachable."""
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(COLLECTION_VERSION_KEY, version_seed(), nx=True)
+            pipe.get(COLLECTION_VERSION_KEY)
+            _, version = await pipe.execute()
+        return int(version)
+    except RedisError:
+        return None
+
+
+async def bump_collection_version() -> None:
+    """Function for marking the listing collection as changed, invalidating its ETags."""
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(COLLECTION_VERSION_KEY, version_seed(), nx=True)
+            pipe.incr(COLLECTION_VERSION_KEY)
+            await pipe.execute()
+    except RedisError as error:
+        print(f'[ETAG] bumping the listing collection version failed: {error!r}')
+
+
+def collection_etag(version: int) -> str:
+    """Function for the strong ETag of a listing collection read at `version`."""
+    return f'"listings-{version}"'
+
+
+def listing_etag(listing: dict) -> str:
+    """Function for the strong ETag of a listing, derived from its `updated_at` (cached listings hold it as a string)."""
+    updated_at = listing['updated_at']
+    if isinstance(updated_at, str):
+        updated_at = datetime.fromisoformat(updated_at)
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return f'"{listing["id"]}-{(updated_at - EPOCH) // timedelta(microseconds=1)}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Function for checking an `If-None-Match` header (`*` or a list of, possibly weak, ETags) against `etag`."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+
+def etag_headers(etag: str | None) -> dict[str, str]:
+    """Function for the headers letting clients cache a response and revalidate it on every use."""
+    if etag is None:
+        return {}
+    return {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+
+def not_modified(etag: str) -> Response:
+    """Function for the empty `304 Not Modified` response to a matching conditional GET."""
+    return Response(status_code=304, headers=etag_headers(etag))
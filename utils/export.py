@@ -0,0 +1,61 @@
+import io
+import csv
+import json
+from datetime import datetime
+from typing import AsyncIterator
+
+from sqlalchemy import Row
+
+from config import Config
+from database import async_session, replica_router
+from schemas import ExportFormat
+from crud.listing import LISTING_COLUMNS, stream_listings
+
+
+EXPORT_FIELDS = [column.key for column in LISTING_COLUMNS]
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: 'application/x-ndjson',
+    ExportFormat.CSV: 'text/csv',
+}
+
+
+def export_value(value):
+    """Function for turning a column value into its exported form."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def to_ndjson(rows: list[Row]) -> str:
+    """Function for writing a batch of rows as newline-delimited JSON objects."""
+    return ''.join(
+        json.dumps(dict(zip(EXPORT_FIELDS, map(export_value, row))), separators=(',', ':')) + '\n'
+        for row in rows
+    )
+
+
+def to_csv(rows: list[Row]) -> str:
+    """Function for writing a batch of rows as CSV lines."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for row in rows:
+        writer.writerow(
+            str(value).lower() if isinstance(value, bool) else export_value(value)
+            for value in row
+        )
+    return buffer.getvalue()
+
+
+async def export_listings(format: ExportFormat, batch_size: int = Config.EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """
+    Function for generating the export of every listing chunk by chunk, one chunk per batch;
+    it holds its own session (on a replica when one is healthy) as it keeps running after the endpoint has returned.
+    """
+    serialize = to_csv if format == ExportFormat.CSV else to_ndjson
+    if format == ExportFormat.CSV:
+        yield (','.join(EXPORT_FIELDS) + '\n').encode()
+
+    async with async_session(info={'replica': replica_router.pick()}) as db:
+        async for rows in stream_listings(db, batch_size):
+            yield serialize(rows).encode()
@@ -1,30 +1,79 @@
 import random
+import asyncio
 from datetime import datetime
 
 from faker import Faker
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import Config
 from crud.user import bulk_insert_users
-from authentication.password_handler import hash_password
+from crud.listing import copy_listings
+from utils.jobs import Job
+from authentication.password_handler import async_hash_password
 
 
-async def generate_fake_users(n: int = 3) -> dict[str, str]:
-    """Function for generating and inserting `n` new fake members."""
+async def generate_fake_users(db: AsyncSession, n: int = 3, job: Job | None = None) -> dict[str, str]:
+    """
+    Function for generating and inserting `n` new fake members, one batch of `FAKE_USERS_BATCH_SIZE`
+    at a time (each one in its own transaction); the users inserted (and the ones skipped as their
+    username or email was taken) are the `users` (and `skipped_users`) progress of `job`.
+    A failed batch raises, failing the job.
+    """
     fake = Faker()
-    fakes = []
-
-    for _ in range(n):
-        fake_user = {
-            'username': fake.user_name(),
-            'full_name': fake.name(),
-            'email': fake.email(),
-            'password': hash_password(fake.password()),  # hashing the passwords take so long!
-            'date_of_birth': fake.date_between_dates(date_start=datetime(1941,1,1), date_end=datetime(2000,12,31)),
-            'gender': random.choice(['MALE', 'FEMALE', 'NOT_SPECIFIED']),
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow(),
-        }
-
-        fakes.append(fake_user)
-    
-    await bulk_insert_users(fakes)
-    return {'RandomUsersGenerated': f'{n} random users were succesfully generated'}
+    total_inserted = 0
+    for batch_start in range(0, n, Config.FAKE_USERS_BATCH_SIZE):
+        batch_size = min(n - batch_start, Config.FAKE_USERS_BATCH_SIZE)
+
+        # hashing the passwords take so long, so they are hashed in parallel inside the process pool,
+        # one round of pool size at a time to leave room in the pool's queue for login requests
+        passwords = []
+        for start in range(0, batch_size, Config.PASSWORD_HASH_WORKERS):
+            hash_round = range(start, min(batch_size, start + Config.PASSWORD_HASH_WORKERS))
+            passwords += await asyncio.gather(*(async_hash_password(fake.password()) for _ in hash_round))
+
+        fakes = []
+        for password in passwords:
+            fake_user = {
+                'username': fake.unique.user_name()[:24],
+                'full_name': fake.name(),
+                'email': fake.unique.email(),
+                'password': password,
+                'date_of_birth': fake.date_between_dates(date_start=datetime(1941,1,1), date_end=datetime(2000,12,31)),
+                'gender': random.choice(['MALE', 'FEMALE', 'NOT_SPECIFIED']),
+                'created_at': datetime.utcnow(),
+                'updated_at': datetime.utcnow(),
+            }
+
+            fakes.append(fake_user)
+
+        response, inserted = await bulk_insert_users(db, fakes)
+        if 'TransactionSuccess' not in response:
+            raise RuntimeError(f'inserting a batch of fake users failed: {response}')
+        total_inserted += inserted
+        if job is not None:
+            job.progress['users'] = job.progress.get('users', 0) + inserted
+            job.progress['skipped_users'] = job.progress.get('skipped_users', 0) + batch_size - inserted
+    return {'RandomUsersGenerated': f'{total_inserted} random users were succesfully generated'}
+
+
+async def generate_fake_listings(db: AsyncSession, owner_ids: list[str], n: int) -> dict[str, str]:
+    """Function for generating and inserting `n` new fake listings, spread over the users of `owner_ids`."""
+    fake = Faker()
+    for start in range(0, n, Config.IMPORT_BATCH_SIZE):
+        current_time = datetime.utcnow()
+        fakes = [
+            {
+                'type': random.choice(['HOUSE', 'APARTMENT']),
+                'available_now': random.random() < 0.7,
+                'owner_id': random.choice(owner_ids),
+                'address': fake.address().replace('\n', ', ')[:255],
+                'created_at': current_time,
+                'updated_at': current_time,
+            }
+            for _ in range(min(n - start, Config.IMPORT_BATCH_SIZE))
+        ]
+
+        response = await copy_listings(db, fakes)
+        if 'TransactionSuccess' not in response:
+            return response
+    return {'RandomListingsGenerated': f'{n} random listings were succesfully generated'}
@@ -0,0 +1,110 @@
+import io
+import csv
+import json
+import time
+import asyncio
+from datetime import datetime
+from itertools import islice
+from typing import Iterator, BinaryIO
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import Config
+from schemas import ExportFormat, ListingAdd
+from crud.listing import copy_listings
+
+
+def read_ndjson(file: BinaryIO) -> Iterator[tuple[int, dict | str]]:
+    """Function for reading an NDJSON file line by line, as `(line number, object or error)` pairs."""
+    for number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield number, f'Invalid JSON: {error}'
+            continue
+        yield number, row if isinstance(row, dict) else 'Expected a JSON object'
+
+
+def read_csv(file: BinaryIO) -> Iterator[tuple[int, dict | str]]:
+    """
+    Function for reading a CSV file with a header line record by record, as `(line number, row or error)`
+    pairs; empty fields are left out so their defaults apply.
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    try:
+        for row in reader:
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ('', None)}
+    except (UnicodeDecodeError, csv.Error) as error:
+        yield reader.line_num + 1, f'Unreadable CSV: {error}'
+    finally:
+        text.detach()  # leave the upload open, it is closed by FastAPI
+
+
+def validate_batch(rows: Iterator[tuple[int, dict | str]], size: int) -> tuple[list[tuple[int, dict]], list[dict], int]:
+    """
+    Function for reading and validating the next `size` rows against `ListingAdd`,
+    returning the valid listings, the errors and the number of rows read.
+    """
+    listings, errors, count = [], [], 0
+    for number, row in islice(rows, size):
+        count += 1
+        if isinstance(row, str):
+            errors.append({'row': number, 'error': row})
+            continue
+        try:
+            listings.append((number, ListingAdd.parse_obj(row).dict()))
+        except ValidationError as error:
+            reasons = '; '.join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}" for item in error.errors())
+            errors.append({'row': number, 'error': reasons})
+    return listings, errors, count
+
+
+async def import_listings(db: AsyncSession, file: BinaryIO, format: ExportFormat, owner_id: str) -> dict:
+    """
+    Function for loading the listings of an uploaded file for `owner_id`, batch by batch;
+    rows are read and validated in a thread as they are needed, so the file is never held in
+    memory, and each batch of valid rows is loaded with one `COPY` in its own transaction.
+    """
+    rows = read_csv(file) if format == ExportFormat.CSV else read_ndjson(file)
+    imported, failed, errors = 0, 0, []
+    start = time.perf_counter()
+
+    while True:
+        listings, row_errors, count = await asyncio.to_thread(validate_batch, rows, Config.IMPORT_BATCH_SIZE)
+        if not count:
+            break
+
+        if listings:
+            current_time = datetime.utcnow()
+            batch = [
+                {
+                    **listing,
+                    'type': listing['type'].value,
+                    'owner_id': owner_id,
+                    'created_at': current_time,
+                    'updated_at': current_time,
+                }
+                for _, listing in listings
+            ]
+            response = await copy_listings(db, batch)
+            if 'TransactionSuccess' in response:
+                imported += len(batch)
+            else:
+                error = next(iter(response.values()))
+                row_errors += [{'row': number, 'error': error} for number, _ in listings]
+
+        failed += len(row_errors)
+        errors += row_errors[:Config.IMPORT_MAX_ERRORS - len(errors)]
+
+    elapsed = time.perf_counter() - start
+    return {
+        'imported': imported,
+        'failed': failed,
+        'errors': sorted(errors, key=lambda error: error['row']),
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(imported / elapsed, 1) if elapsed else 0.0,
+    }
@@ -0,0 +1,284 @@
+import json
+import asyncio
+from uuid import uuid4
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from config import Config
+from database import async_session
+from caching import redis_client
+from utils.cache import listen_for_invalidations
+
+
+# saves a job only while its stored status is still the expected one (e.g. a cancelled job is never started)
+TRANSITION_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw or cjson.decode(raw)['status'] ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+transition_script = redis_client.register_script(TRANSITION_SCRIPT)
+
+
+class Job:
+    """A background job and its progress, as shown by the job status endpoint."""
+    def __init__(self, name: str, owner_id: str, params: dict | None = None):
+        self.id = uuid4().hex
+        self.name = name
+        self.owner_id = owner_id
+        self.params = params or {}  # the keyword arguments of the job function, JSON serializable
+        self.status = 'PENDING'
+        self.progress: dict[str, int] = {}  # e.g. the number of rows deleted so far, by table
+        self.error: str | None = None
+        self.created_at = datetime.utcnow()
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('SUCCEEDED', 'FAILED', 'CANCELLED')
+
+    def view(self) -> dict:
+        """Return the job as it is shown."""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+    def to_json(self) -> str:
+        """Encode the job, to be stored in Redis."""
+        return json.dumps(
+            {**self.view(), 'owner_id': self.owner_id, 'params': self.params},
+            default=lambda item: item.isoformat(),
+        )
+
+    @classmethod
+    def from_json(cls, raw: str | bytes) -> 'Job':
+        """Decode a job stored in Redis."""
+        data = json.loads(raw)
+        job = cls(data['name'], data['owner_id'], data['params'])
+        job.id, job.status, job.progress, job.error = data['id'], data['status'], data['progress'], data['error']
+        for field in ('created_at', 'started_at', 'finished_at'):
+            setattr(job, field, datetime.fromisoformat(data[field]) if data[field] else None)
+        return job
+
+    def copy(self) -> 'Job':
+        """Return a copy of the job, as it would be stored."""
+        return Job.from_json(self.to_json())
+
+
+class MemoryJobStore:
+    """
+    Keeps (copies of) the jobs and their queue in the memory of this worker, like Redis would;
+    the `max_finished` most recent finished jobs are kept.
+    """
+    def __init__(self, max_finished: int):
+        self.max_finished = max_finished
+        self.jobs: dict[str, Job] = {}
+        self.queue: asyncio.Queue[str] = asyncio.Queue()
+
+    async def save(self, job: Job) -> None:
+        self.jobs[job.id] = job.copy()
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job.id]
+
+    async def transition(self, job: Job, status: str) -> bool:
+        stored = self.jobs.get(job.id)
+        if stored is None or stored.status != status:
+            return False
+        await self.save(job)
+        return True
+
+    async def load(self, id: str) -> Job | None:
+        job = self.jobs.get(id)
+        return job.copy() if job is not None else None
+
+    async def enqueue(self, job: Job) -> None:
+        await self.queue.put(job.id)
+
+    async def dequeue(self) -> str | None:
+        return await self.queue.get()
+
+
+class RedisJobStore:
+    """
+    Keeps the jobs (for `ttl` seconds) and their queue in Redis, so every worker process
+    can answer the status of a job, and the first free worker of any process runs it.
+    """
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.queue = 'jobs:queue'
+
+    def key(self, id: str) -> str:
+        return f'jobs:{id}'
+
+    async def save(self, job: Job) -> None:
+        await redis_client.set(self.key(job.id), job.to_json(), ex=self.ttl)
+
+    async def transition(self, job: Job, status: str) -> bool:
+        return bool(await transition_script(keys=[self.key(job.id)], args=[status, job.to_json(), self.ttl]))
+
+    async def load(self, id: str) -> Job | None:
+        raw = await redis_client.get(self.key(id))
+        return Job.from_json(raw) if raw is not None else None
+
+    async def enqueue(self, job: Job) -> None:
+        await redis_client.rpush(self.queue, job.id)
+
+    async def dequeue(self) -> str | None:
+        # a short blocking pop, so an idle worker holds a pooled connection only briefly
+        popped = await redis_client.blpop([self.queue], timeout=1)
+        return popped[1].decode() if popped is not None else None
+
+
+class JobRegistry:
+    """
+    Asyncio worker pool running the registered job functions in the background, at most
+    `concurrency` at a time, so a request can start a long operation, return its job id
+    right away and let the client poll (or cancel) the job.
+
+    Jobs are submitted by name with JSON serializable parameters; with the Redis store any
+    worker process can pick them up, and a cancellation reaches the process running the job
+    through a Redis channel. The progress of a running job is saved every `progress_interval` seconds.
+    """
+    def __init__(self, store: MemoryJobStore | RedisJobStore, concurrency: int, progress_interval: float):
+        self.store = store
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self.functions: dict[str, Callable[..., Awaitable[None]]] = {}
+        self.running: dict[str, asyncio.Task] = {}
+        self.workers: list[asyncio.Task] = []
+        self.channel = 'job_cancellation'
+
+    def register(self, name: str, function: Callable[..., Awaitable[None]]) -> None:
+        """Register `function(job, **params)` as the job `name`."""
+        self.functions[name] = function
+
+    async def submit(self, name: str, owner_id: str, **params) -> Job:
+        """Queue the job `name` with `params` and return it."""
+        if name not in self.functions:
+            raise KeyError(name)
+        job = Job(name, owner_id, params)
+        await self.store.save(job)
+        await self.store.enqueue(job)
+        return job
+
+    async def get(self, id: str) -> Job | None:
+        """Return a job by its id."""
+        return await self.store.load(id)
+
+    async def cancel(self, id: str) -> Job | None:
+        """Cancel a job; a queued job is skipped, a running one stops at its next `await`."""
+        job = await self.store.load(id)
+        if job is None or job.finished:
+            return job
+        if job.status == 'PENDING':
+            job.status = 'CANCELLED'
+            job.finished_at = datetime.utcnow()
+            if await self.store.transition(job, 'PENDING'):
+                return job
+            # a worker started it meanwhile
+            job = await self.store.load(id)
+            if job is None or job.finished:
+                return job
+        if id in self.running:
+            self.running[id].cancel()
+        elif isinstance(self.store, RedisJobStore):
+            await redis_client.publish(self.channel, json.dumps(id))
+        return job
+
+    async def run(self, job: Job) -> None:
+        """Run a job, saving its progress now and then and recording how it ended."""
+        job.status = 'RUNNING'
+        job.started_at = datetime.utcnow()
+        # the job may have been cancelled since it was loaded, then it is skipped
+        if not await self.store.transition(job, 'PENDING'):
+            return
+
+        task = asyncio.create_task(self.functions[job.name](job, **job.params))
+        self.running[job.id] = task
+        stopping = False
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=self.progress_interval)
+                if not task.done():
+                    await self.store.save(job)
+            task.result()
+            job.status = 'SUCCEEDED'
+        except asyncio.CancelledError:
+            job.status = 'CANCELLED'
+            if not task.done():
+                # the worker itself is being stopped, the job stops along with it
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                stopping = True
+        except Exception as error:
+            job.status = 'FAILED'
+            job.error = repr(error)
+            print(f'[JOBS] {job.name} {job.id} failed: {error!r}')
+        finally:
+            job.finished_at = datetime.utcnow()
+            self.running.pop(job.id, None)
+            await self.store.save(job)
+        if stopping:
+            raise asyncio.CancelledError
+
+    async def work(self) -> None:
+        """Run the queued jobs one after the other, as one worker of the pool."""
+        while True:
+            try:
+                id = await self.store.dequeue()
+                job = await self.store.load(id) if id is not None else None
+            except Exception as error:
+                print(f'[JOBS] reading the job queue failed: {error!r}')
+                await asyncio.sleep(1)
+                continue
+            # jobs cancelled while they were queued are skipped
+            if job is not None and job.status == 'PENDING':
+                await self.run(job)
+
+    def cancel_local(self, id: str) -> None:
+        """Cancel a job cancelled on another worker process, if this one runs it."""
+        if id in self.running:
+            self.running[id].cancel()
+
+    def start(self) -> None:
+        """Start the workers of the pool (and the cancellation listener, with Redis)."""
+        self.workers = [asyncio.create_task(self.work()) for _ in range(self.concurrency)]
+        if isinstance(self.store, RedisJobStore):
+            self.workers.append(asyncio.create_task(
+                listen_for_invalidations(self.channel, self.cancel_local, lambda: None)
+            ))
+
+    async def stop(self) -> None:
+        """Stop the workers, cancelling the running jobs (whatever they committed stays)."""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+
+def with_session(function) -> Callable[..., Awaitable[None]]:
+    """Function for running `function(db, job=job, **params)` as a job, with a database session of its own."""
+    async def work(job: Job, **params) -> None:
+        async with async_session() as db:
+            await function(db, job=job, **params)
+    return work
+
+
+# the job worker pool of this process (sharing its jobs with the other processes with `JOBS_BACKEND=redis`)
+jobs = JobRegistry(
+    RedisJobStore(Config.JOB_TTL) if Config.JOBS_BACKEND == 'redis' else MemoryJobStore(Config.MAX_FINISHED_JOBS),
+    concurrency=Config.JOB_CONCURRENCY,
+    progress_interval=Config.JOB_PROGRESS_INTERVAL,
+)
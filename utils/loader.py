@@ -0,0 +1,89 @@
+import asyncio
+from functools import partial
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from schemas import ListingExpand
+from database import get_read_db
+from crud.user import fetch_users_by_ids
+
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class BatchLoader(Generic[K, V]):
+    """
+    Per-request loader resolving keys in batches: the keys asked for before the event loop
+    gets to run the pending batch are fetched together, by a single call of `fetch`
+    (e.g. one `IN (...)` query), and every key is fetched at most once per loader.
+
+    `fetch` is given a list of distinct keys and returns the values found, by key;
+    missing keys resolve to `None`.
+    """
+    def __init__(self, fetch: Callable[[list[K]], Awaitable[dict[K, V]]]):
+        self.fetch = fetch
+        self.results: dict[K, asyncio.Future] = {}
+        self.queue: list[K] = []
+        self.lock = asyncio.Lock()  # the batches share the session of the request, so they run one at a time
+        self.tasks: set[asyncio.Task] = set()
+
+    def load(self, key: K) -> Awaitable[V | None]:
+        """Return an awaitable of the value of `key`, queueing the key for the next batch."""
+        future = self.results.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.results[key] = loop.create_future()
+            if not self.queue:
+                task = loop.create_task(self.dispatch())
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            self.queue.append(key)
+        return future
+
+    async def load_many(self, keys: list[K]) -> list[V | None]:
+        """Return the values of `keys`, in order, fetching the missing ones in one batch."""
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    async def dispatch(self) -> None:
+        """Fetch every queued key with one call of `fetch`."""
+        async with self.lock:
+            keys, self.queue = self.queue, []
+            try:
+                values = await self.fetch(keys)
+            except Exception as error:
+                # failed keys are forgotten, so a later `load` tries them again
+                for key in keys:
+                    self.results.pop(key).set_exception(error)
+                return
+            for key in keys:
+                self.results[key].set_result(values.get(key))
+
+
+class Loaders:
+    """The batch loaders of one request, sharing its session; a new nested field adds its loader here."""
+    def __init__(self, db: AsyncSession):
+        self.owners: BatchLoader[str, dict] = BatchLoader(partial(fetch_users_by_ids, db))
+
+
+async def get_loaders(db: AsyncSession = Depends(get_read_db)) -> Loaders:
+    """dependency for handing each request its own batch loaders, on the request's (read-only) session."""
+    return Loaders(db)
+
+
+async def expand_listings(listings: list[dict], expand: list[ListingExpand], loaders: Loaders) -> list[dict]:
+    """
+    Function for embedding the nested fields of `expand` into copies of `listings`
+    (cached listings are shared), resolving each field with one batch for every listing.
+    """
+    expanded = [dict(listing) for listing in listings]
+    if ListingExpand.OWNER in expand:
+        owners = await loaders.owners.load_many([listing['owner_id'] for listing in expanded])
+        for listing, owner in zip(expanded, owners):
+            listing['owner'] = owner
+
+    for listing in expanded:
+        listing.pop('owner_id', None)
+    return expanded
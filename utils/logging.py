@@ -1,10 +1,136 @@
-from fastapi import Request
+import os
+import time
+import asyncio
+from collections import deque
 from datetime import datetime
 
+from fastapi import Request
+
+from config import Config
+
+
+class AccessLogWriter:
+    """
+    Buffered access log writer; request lines are kept in an in-memory ring buffer
+    and a background task appends them to the log file in batches, whenever
+    `flush_size` lines are waiting or every `flush_interval` seconds.
+
+    When the buffer is full the oldest lines are dropped (and counted), so a slow
+    disk can never make the app run out of memory or stall the event loop.
+    """
+    def __init__(
+        self,
+        path: str,
+        buffer_size: int,
+        flush_size: int,
+        flush_interval: float,
+        max_bytes: int,
+        backup_count: int,
+        name: str = 'ACCESS LOG',
+    ):
+        self.path = path
+        self.name = name
+        self.buffer: deque[str] = deque(maxlen=buffer_size)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self.flush_needed = asyncio.Event()
+        self.stopping = False
+        self.task: asyncio.Task | None = None
+
+    def write(self, line: str) -> None:
+        """Queue a line to be written with the next batch."""
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(line)
+        if len(self.buffer) >= self.flush_size:
+            self.flush_needed.set()
+
+    def rotate(self) -> None:
+        """Shift the log file (e.g. `logs.txt`) to `logs.txt.1`, `logs.txt.1` to `logs.txt.2` and so on."""
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f'{self.path}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.path}.{index + 1}')
+        if self.backup_count > 0:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+
+    def write_batch(self, lines: list[str]) -> None:
+        """Append a batch of lines to the log file, rotating it once it grows too big (runs in a thread)."""
+        data = ''.join(lines)
+        if self.max_bytes > 0 and os.path.exists(self.path):
+            if os.path.getsize(self.path) + len(data) > self.max_bytes:
+                self.rotate()
+        with open(self.path, 'a') as file:
+            file.write(data)
+
+    async def flush(self) -> None:
+        """Write every buffered line to the log file."""
+        self.flush_needed.clear()
+        lines = []
+        while self.buffer:
+            lines.append(self.buffer.popleft())
+        if self.dropped:
+            lines.append(f'[{self.name}] {self.dropped} lines were dropped as the log buffer was full\n')
+            self.dropped = 0
+        if lines:
+            await asyncio.to_thread(self.write_batch, lines)
+
+    async def run(self) -> None:
+        """Flush the buffer on size or time thresholds, until the writer is stopped."""
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.flush_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except OSError as error:
+                print(f'[{self.name}] writing {self.path} failed: {error!r}')
+
+    def start(self) -> None:
+        """Start flushing the buffer in the background."""
+        self.stopping = False
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop the background task and drain the remaining lines."""
+        # the task is woken up rather than cancelled, so a batch is never cut in half
+        self.stopping = True
+        self.flush_needed.set()
+        if self.task is not None:
+            await self.task
+            self.task = None
+        await self.flush()
+
+
+# the access log writer of this worker
+access_log = AccessLogWriter(
+    path=Config.ACCESS_LOG_PATH,
+    buffer_size=Config.ACCESS_LOG_BUFFER_SIZE,
+    flush_size=Config.ACCESS_LOG_FLUSH_SIZE,
+    flush_interval=Config.ACCESS_LOG_FLUSH_INTERVAL,
+    max_bytes=Config.ACCESS_LOG_MAX_BYTES,
+    backup_count=Config.ACCESS_LOG_BACKUP_COUNT,
+)
+
 
 async def log_request(request: Request, call_next) -> None:
-    """Function for logging every request's IP address and exact time."""
-    with open('logs.txt', 'a') as file:
-        file.write(f'[TIME] {datetime.utcnow()}  -  [IP] {request.client.host}\n')
-    response = await call_next(request)
-    return response
+    """Function for logging every request's IP address, exact time, status and latency."""
+    start = time.perf_counter()
+    status_code = 500  # kept when the request raises an unhandled exception
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        latency = (time.perf_counter() - start) * 1000
+        ip = request.client.host if request.client else '-'
+        access_log.write(
+            f'[TIME] {datetime.utcnow()}  -  [IP] {ip}  -  [REQUEST] {request.method} {request.url.path}'
+            f'  -  [STATUS] {status_code}  -  [LATENCY] {latency:.2f}ms\n'
+        )
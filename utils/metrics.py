@@ -0,0 +1,140 @@
+import os
+import time
+
+from fastapi import Request, Response
+from starlette.routing import Match
+from prometheus_client import (
+    Counter, Gauge, Histogram,
+    CollectorRegistry, REGISTRY, generate_latest, CONTENT_TYPE_LATEST,
+)
+from prometheus_client import multiprocess
+from redis.asyncio import Redis
+
+
+# every worker only updates its own values (in memory, or in its own files when
+# `PROMETHEUS_MULTIPROC_DIR` is set), the values of all workers are summed up when scraped
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+requests_total = Counter(
+    'http_requests_total', 'Requests answered, by route template and status.',
+    ['method', 'route', 'status'],
+)
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Request latency, by route template.',
+    ['method', 'route'],
+)
+requests_in_progress = Gauge(
+    'http_requests_in_progress', 'Requests being answered, by route template.',
+    ['method', 'route'], multiprocess_mode='livesum',
+)
+db_query_duration = Histogram(
+    'db_query_duration_seconds', 'Database statement latency, by statement type.',
+    ['operation'], buckets=FAST_BUCKETS,
+)
+db_pool_checkout_wait = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled database connection.',
+    buckets=FAST_BUCKETS,
+)
+redis_command_duration = Histogram(
+    'redis_command_duration_seconds', 'Redis command latency, by command.',
+    ['command'], buckets=FAST_BUCKETS,
+)
+password_hash_queue_depth = Gauge(
+    'password_hash_queue_depth', 'Password hashing calls running or waiting in the bcrypt process pool.',
+    multiprocess_mode='livesum',
+)
+startup_step_duration = Gauge(
+    'startup_step_duration_seconds', 'Time taken by every step of the last startup, by step.',
+    ['step'], multiprocess_mode='max',
+)
+
+
+def route_template(request: Request) -> str:
+    """
+    Function for finding the path template of the route a request matches, keeping the label set bounded.
+    The routes are only scanned once per request: the middlewares run before the router has matched
+    the request (which then sets `scope['route']`), so the template is kept in the request's state.
+    """
+    route = request.scope.get('route')
+    if route is not None:
+        return route.path
+    template = getattr(request.state, 'route_template', None)
+    if template is None:
+        template = '<unmatched>'
+        for route in request.app.router.routes:
+            match, _ = route.matches(request.scope)
+            if match == Match.FULL:
+                template = route.path
+                break
+        request.state.route_template = template
+    return template
+
+
+async def measure_request(request: Request, call_next) -> Response:
+    """Function for counting and timing every request by its route template."""
+    method, route = request.method, route_template(request)
+    in_progress = requests_in_progress.labels(method, route)
+    in_progress.inc()
+    start = time.perf_counter()
+    status_code = 500  # kept when the request raises an unhandled exception
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        request_duration.labels(method, route).observe(time.perf_counter() - start)
+        requests_total.labels(method, route, str(status_code)).inc()
+        in_progress.dec()
+
+
+def instrument_engine(engine) -> None:
+    """Function for timing every statement executed through a (sync) SQLAlchemy engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        if operation not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'):
+            operation = 'OTHER'
+        db_query_duration.labels(operation).observe(elapsed)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        # the failed statement never reaches `after_cursor_execute`
+        starts = context.connection.info.get('query_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+class TimedRedis(Redis):
+    """Asyncio Redis client timing every command it sends (pipelines are not timed)."""
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            command = args[0] if isinstance(args[0], str) else args[0].decode()
+            redis_command_duration.labels(command.upper()).observe(time.perf_counter() - start)
+
+
+def render_metrics() -> Response:
+    """Function for rendering the metrics of every worker in the Prometheus text format."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_dead() -> None:
+    """Function for dropping the live gauges of this worker from the aggregated metrics."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,33 @@
+import json
+import base64
+import binascii
+from datetime import datetime
+
+from config import error_message
+
+
+def encode_cursor(sort_value: datetime, id: str) -> str:
+    """Function for turning the keyset of the last row of a page into an opaque cursor."""
+    raw = json.dumps([sort_value.isoformat(), id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """Function for reading the `(sort_value, id)` keyset back out of an opaque cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, id = json.loads(raw)
+        return datetime.fromisoformat(sort_value), str(id)
+    except (binascii.Error, ValueError, TypeError):
+        raise error_message[400]
+
+
+def build_page(rows: list, page_size: int, sort_key: str = 'created_at') -> dict[str, list[dict] | str | None]:
+    """
+    Function for shaping the rows of a keyset query into a page (keeping their native types),
+    the query is expected to fetch one extra row to detect a next page.
+    """
+    has_next_page = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_cursor(getattr(rows[-1], sort_key), rows[-1].id) if has_next_page else None
+    return {'items': [row._asdict() for row in rows], 'next_cursor': next_cursor}
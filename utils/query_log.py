@@ -0,0 +1,275 @@
+import re
+import time
+import asyncio
+from datetime import datetime
+from functools import wraps
+from contextvars import ContextVar
+from collections import Counter
+from inspect import isasyncgenfunction
+
+from fastapi import Request, Response
+
+from config import Config
+from utils.metrics import route_template
+from utils.logging import AccessLogWriter
+
+
+PLACEHOLDER = re.compile(r'%s|\$\d+|%\(\w+\)s')
+PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+WHITESPACE = re.compile(r'\s+')
+# string constants of a plan (the parameters of a custom plan show up as such)
+PLAN_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+
+def fingerprint(statement: str) -> str:
+    """Function for reducing a statement to its shape, so statements differing only in their parameters are grouped."""
+    statement = PLACEHOLDER.sub('?', WHITESPACE.sub(' ', statement).strip())
+    # `IN` lists of any length look the same
+    return PLACEHOLDER_LIST.sub('(?, ...)', statement)
+
+
+def describe_parameters(parameters) -> list[str]:
+    """
+    Function for the types of the parameters of a statement; their values (password hashes,
+    emails and so on) are never logged.
+    """
+    if isinstance(parameters, dict):
+        parameters = parameters.values()
+    elif not isinstance(parameters, (list, tuple)):
+        parameters = [parameters]
+    return [type(value).__name__ for value in parameters]
+
+
+def redact_plan(plan: str) -> str:
+    """Function for hiding the constants of a plan, the parameter values of the statement among them."""
+    return PLAN_LITERAL.sub("'?'", plan)
+
+
+# the innermost `crud` function running, set by `traced` (the engine events run in a greenlet, off its stack)
+current_caller: ContextVar[str] = ContextVar('current_caller', default='-')
+
+
+def traced(function):
+    """Decorator for a `crud` function, so the statements it executes are logged along with its name."""
+    name = f'{function.__module__}.{function.__name__}'
+
+    if isasyncgenfunction(function):
+        @wraps(function)
+        async def generator_wrapper(*args, **kwargs):
+            iterator = function(*args, **kwargs)
+            try:
+                while True:
+                    token = current_caller.set(name)
+                    try:
+                        item = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        current_caller.reset(token)
+                    yield item
+            finally:
+                await iterator.aclose()
+        return generator_wrapper
+
+    @wraps(function)
+    async def wrapper(*args, **kwargs):
+        token = current_caller.set(name)
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            current_caller.reset(token)
+    return wrapper
+
+
+class RequestQueries:
+    """The statements executed while answering one request."""
+    def __init__(self, route: str):
+        self.route = route
+        self.shapes: Counter[str] = Counter()
+        self.identical: Counter[tuple[str, str]] = Counter()
+
+    def add(self, shape: str, parameters) -> None:
+        self.shapes[shape] += 1
+        self.identical[shape, repr(parameters)] += 1
+
+
+# the statements of the request being answered, set by `track_queries`
+current_request: ContextVar[RequestQueries | None] = ContextVar('current_request', default=None)
+
+
+class SlowQueryLog:
+    """
+    Log of the statements taking longer than `threshold` seconds, written to a rotating
+    file (through the buffered `log` writer, off the event loop) and summed up by fingerprint
+    (in memory) for the top-N admin endpoint. Only the types of the parameters are kept.
+
+    An `EXPLAIN (ANALYZE, BUFFERS)` of a slow `SELECT` is captured in the background
+    when `explain` is set, once per fingerprint. Statements repeated within a single
+    request (N+1 patterns) are logged as well.
+    """
+    def __init__(
+        self,
+        log: AccessLogWriter,
+        threshold: float,
+        explain: bool,
+        repeat_threshold: int,
+        max_fingerprints: int,
+    ):
+        self.log = log
+        self.threshold = threshold
+        self.explain = explain
+        self.repeat_threshold = repeat_threshold
+        self.max_fingerprints = max_fingerprints
+        self.fingerprints: dict[str, dict] = {}
+        self.explaining: set[str] = set()
+        self.tasks: set[asyncio.Task] = set()
+
+    def write(self, message: str) -> None:
+        """Queue a line of the log, written with the next batch."""
+        self.log.write(f'[TIME] {datetime.utcnow()}  -  {message}\n')
+
+    def record(self, statement: str, parameters, elapsed: float, executemany: bool, engine) -> None:
+        """Count a statement against the current request, and log it if it was slow."""
+        shape = fingerprint(statement)
+        queries = current_request.get()
+        if queries is not None and not executemany:
+            queries.add(shape, parameters)
+
+        if elapsed < self.threshold:
+            return
+
+        route = queries.route if queries is not None else '-'
+        caller = current_caller.get()
+        sample = {
+            'statement': statement,
+            'parameter_types': describe_parameters(parameters),
+            'duration_ms': round(elapsed * 1000, 2),
+            'route': route,
+            'caller': caller,
+            'at': datetime.utcnow().isoformat(),
+        }
+        self.write(
+            f'[SLOW QUERY] {sample["duration_ms"]}ms  -  [ROUTE] {route}  -  [CALLER] {caller}'
+            f'  -  [SQL] {WHITESPACE.sub(" ", statement).strip()}  -  [PARAMETER TYPES] {sample["parameter_types"]}'
+        )
+
+        entry = self.fingerprints.get(shape)
+        if entry is None:
+            if len(self.fingerprints) >= self.max_fingerprints:
+                # forget the fastest fingerprint to keep the memory bounded
+                del self.fingerprints[min(self.fingerprints, key=lambda key: self.fingerprints[key]['max_ms'])]
+            entry = self.fingerprints[shape] = {
+                'fingerprint': shape, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'slowest': None, 'explain': None,
+            }
+        entry['count'] += 1
+        entry['total_ms'] += sample['duration_ms']
+        if sample['duration_ms'] >= entry['max_ms']:
+            entry['max_ms'] = sample['duration_ms']
+            entry['slowest'] = sample
+
+        is_select = shape.upper().startswith(('SELECT', 'WITH'))
+        if self.explain and is_select and not executemany and entry['explain'] is None and shape not in self.explaining:
+            self.schedule_explain(engine, shape, statement, parameters)
+
+    def schedule_explain(self, engine, shape: str, statement: str, parameters) -> None:
+        """Capture the plan of a slow statement in the background, the request is not held up."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.explaining.add(shape)
+        task = loop.create_task(self.capture_explain(engine, shape, statement, parameters))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def capture_explain(self, engine, shape: str, statement: str, parameters) -> None:
+        """Run `EXPLAIN (ANALYZE, BUFFERS)` of a statement on its own connection (of the same engine) and keep the plan."""
+        try:
+            async with engine.connect() as conn:
+                # `ANALYZE` runs the statement, it is rolled back along with the transaction
+                async with conn.begin() as transaction:
+                    result = await conn.exec_driver_sql(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters)
+                    plan = redact_plan('\n'.join(row[0] for row in result.all()))
+                    await transaction.rollback()
+        except Exception as error:
+            plan = f'EXPLAIN failed: {error!r}'
+        finally:
+            self.explaining.discard(shape)
+
+        if shape in self.fingerprints:
+            self.fingerprints[shape]['explain'] = plan
+        self.write(f'[EXPLAIN] {shape}\n{plan}')
+
+    def check_repeats(self, queries: RequestQueries) -> None:
+        """Log the statements a request repeated, identical ones or the same shape over and over (N+1)."""
+        for (shape, _), count in queries.identical.items():
+            if count > 1:
+                self.write(f'[REPEATED QUERY] {count}x identical  -  [ROUTE] {queries.route}  -  [SQL] {shape}')
+        for shape, count in queries.shapes.items():
+            if count >= self.repeat_threshold:
+                self.write(f'[N+1 QUERY] {count}x  -  [ROUTE] {queries.route}  -  [SQL] {shape}')
+
+    def top(self, n: int) -> list[dict]:
+        """Return the `n` slowest fingerprints, by their slowest execution."""
+        entries = sorted(self.fingerprints.values(), key=lambda entry: entry['max_ms'], reverse=True)[:n]
+        return [{**entry, 'total_ms': round(entry['total_ms'], 2)} for entry in entries]
+
+    def instrument(self, engine) -> None:
+        """Start timing every statement executed through an async engine (the primary or a replica)."""
+        from sqlalchemy import event
+
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+        @event.listens_for(sync_engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['slow_query_start'].pop()
+            if not statement.lstrip().upper().startswith('EXPLAIN'):
+                self.record(statement, parameters, elapsed, executemany, engine)
+
+        @event.listens_for(sync_engine, 'handle_error')
+        def handle_error(context):
+            starts = context.connection.info.get('slow_query_start') if context.connection is not None else None
+            if starts:
+                starts.pop()
+
+    def start(self) -> None:
+        """Start writing the log in the background."""
+        self.log.start()
+
+    async def stop(self) -> None:
+        """Wait for the running `EXPLAIN`s and write the remaining lines."""
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.log.stop()
+
+
+# the slow-query log of this worker, fed by the engine events of `database.py`
+slow_query_log = SlowQueryLog(
+    AccessLogWriter(
+        path=Config.SLOW_QUERY_LOG_PATH,
+        buffer_size=Config.ACCESS_LOG_BUFFER_SIZE,
+        flush_size=Config.ACCESS_LOG_FLUSH_SIZE,
+        flush_interval=Config.ACCESS_LOG_FLUSH_INTERVAL,
+        max_bytes=Config.SLOW_QUERY_LOG_MAX_BYTES,
+        backup_count=Config.SLOW_QUERY_LOG_BACKUP_COUNT,
+        name='SLOW QUERY LOG',
+    ),
+    threshold=Config.SLOW_QUERY_THRESHOLD / 1000,
+    explain=Config.SLOW_QUERY_EXPLAIN,
+    repeat_threshold=Config.REPEATED_QUERY_THRESHOLD,
+    max_fingerprints=Config.SLOW_QUERY_MAX_FINGERPRINTS,
+)
+
+
+async def track_queries(request: Request, call_next) -> Response:
+    """Function for collecting the statements of every request, logging the ones it repeated."""
+    queries = RequestQueries(route_template(request))
+    token = current_request.set(queries)
+    try:
+        return await call_next(request)
+    finally:
+        current_request.reset(token)
+        slow_query_log.check_repeats(queries)
@@ -1,30 +1,151 @@
+import time
+import math
+from typing import NamedTuple
+
+from jose import jwt, JWTError
 from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from redis.exceptions import RedisError
 
 from config import Config
 from caching import redis_client
 
 
-rate = Config.RATE_LIMIT
-rate_expiry = Config.RATE_LIMIT_EXPIRY_IN_SECONDS
-token_path = Config.TOKEN_URL
+class RateLimitRule(NamedTuple):
+    """A limit of `limit` requests every `period` seconds, counted per `'ip'` or per `'user'`."""
+    limit: int
+    period: int
+    key_by: str = 'ip'
+
+
+class RateLimitResult(NamedTuple):
+    """The outcome of a rate-limit check."""
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+# Generic Cell Rate Algorithm, checked and updated in one atomic round trip;
+# the key holds the "theoretical arrival time" (in ms) of the next request, and every
+# argument is a whole number of milliseconds (`PX` rejects fractions)
+GCRA_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+
+local new_tat = tat + interval
+local allow_at = new_tat - period
+if now < allow_at then
+    return {0, 0, allow_at - now}
+end
+
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {1, math.floor((period - (new_tat - now)) / interval), 0}
+"""
+
+gcra_script = redis_client.register_script(GCRA_SCRIPT)
+
+
+class LocalRateLimiter:
+    """In-process GCRA limiter, used as a fallback while Redis is unreachable."""
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self.tats: dict[str, float] = {}
+
+    def check(self, key: str, interval: float, period: float) -> RateLimitResult:
+        """Count one request against `key`, `interval` and `period` being in milliseconds."""
+        now = time.monotonic() * 1000
+        if len(self.tats) >= self.max_keys:
+            # forget the keys whose bucket is already full again
+            self.tats = {key: tat for key, tat in self.tats.items() if tat > now}
+
+        tat = max(self.tats.get(key, now), now)
+        new_tat = tat + interval
+        allow_at = new_tat - period
+        if now < allow_at:
+            return RateLimitResult(False, 0, (allow_at - now) / 1000)
 
+        self.tats[key] = new_tat
+        return RateLimitResult(True, math.floor((period - (new_tat - now)) / interval), 0)
 
-async def limit_requests(request: Request, call_next) -> None | Response:
-    """Function for limiting authentication requests based on settings in Config."""
-    if request.url.path != token_path:  # no need to limit other requests, only login attempts
+
+local_limiter = LocalRateLimiter()
+
+
+async def check_rate_limit(key: str, rule: RateLimitRule) -> RateLimitResult:
+    """Function for counting one request against `key`, in Redis or in-process when Redis is down."""
+    # rounded up to whole milliseconds (e.g. `7/60` is one request every 8572ms), the period
+    # following it so a full burst of `limit` requests still fits
+    interval = math.ceil(rule.period * 1000 / rule.limit)
+    period = interval * rule.limit
+    try:
+        allowed, remaining, retry_after = await gcra_script(keys=[key], args=[interval, period])
+        return RateLimitResult(bool(allowed), int(remaining), int(retry_after) / 1000)
+    except RedisError:
+        return local_limiter.check(key, interval, period)
+
+
+# the rules of Config, checked from the longest path prefix to the shortest
+rules = sorted(
+    ((prefix, RateLimitRule(*rule)) for prefix, rule in Config.RATE_LIMIT_RULES.items()),
+    key=lambda item: len(item[0]),
+    reverse=True,
+)
+
+
+def match_rule(path: str) -> tuple[str, RateLimitRule] | None:
+    """Function for finding the rule with the longest path prefix matching `path`."""
+    for prefix, rule in rules:
+        if path.startswith(prefix):
+            return prefix, rule
+    return None
+
+
+def identify_client(request: Request, rule: RateLimitRule) -> str:
+    """
+    Function for identifying who a request is counted against; per-user rules use the
+    (verified) subject of the bearer token and fall back to the IP for anonymous requests.
+    """
+    if rule.key_by == 'user':
+        scheme, _, token = request.headers.get('authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and token:
+            try:
+                user_id = jwt.decode(token, Config.JWT_SECRET, algorithms=[Config.JWT_ALGORITHM]).get('sub')
+                if user_id is not None:
+                    return f'user:{user_id}'
+            except JWTError:
+                pass
+    return f'ip:{request.client.host if request.client else "-"}'
+
+
+async def limit_requests(request: Request, call_next) -> Response:
+    """Function for limiting requests based on the rules in Config."""
+    matched = match_rule(request.url.path)
+    if matched is None:
         return await call_next(request)
 
-    ip = request.client.host
-    key = f'user_ip:{ip}'
-    request_count = redis_client.get(key)
-
-    if request_count is None:
-        redis_client.set(key, 1)
-        redis_client.expire(key, rate_expiry)
-    elif int(request_count) < rate:  # casting to `int` as Redis stores numbers as `bytes` type
-        redis_client.incr(key)
-    else:
-        raise Response("Authentication Rate-Limit reached", status_code=403)
-    
+    prefix, rule = matched
+    key = f'rate_limit:{prefix}:{identify_client(request, rule)}'
+    result = await check_rate_limit(key, rule)
+
+    if not result.allowed:
+        return JSONResponse(
+            {'detail': 'Rate-Limit reached / Try again later'},
+            status_code=429,
+            headers={
+                'Retry-After': str(math.ceil(result.retry_after)),
+                'X-RateLimit-Limit': str(rule.limit),
+                'X-RateLimit-Remaining': '0',
+            },
+        )
+
     response = await call_next(request)
+    response.headers['X-RateLimit-Limit'] = str(rule.limit)
+    response.headers['X-RateLimit-Remaining'] = str(result.remaining)
     return response
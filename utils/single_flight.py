@@ -0,0 +1,133 @@
+import asyncio
+from uuid import uuid4
+from typing import Awaitable, Callable, TypeVar
+
+from redis.exceptions import RedisError
+
+from config import Config
+from caching import redis_client
+
+
+T = TypeVar('T')
+
+# deletes the lock only if it is still held by the caller (it may have expired and been taken since)
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+release_script = redis_client.register_script(RELEASE_SCRIPT)
+
+
+class SingleFlight:
+    """
+    Coalesces the concurrent calls for the same key into one in-flight call, whose result
+    (or error) is shared by every caller waiting for it in this worker.
+
+    With `distributed` set, the call is also guarded by a short Redis lock, so it holds across
+    the workers: the ones missing the lock wait (up to `lock_ttl` seconds) for its holder to
+    fill the cache, polling `lookup`, instead of running the call themselves.
+    Redis errors fall back to running the call.
+    """
+    def __init__(self, name: str, distributed: bool, lock_ttl: float, poll_interval: float):
+        self.name = name
+        self.distributed = distributed
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.calls: dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.lock_waits = 0
+        self.lock_timeouts = 0
+
+    async def do(self, key: str, function: Callable[[], Awaitable[T]], lookup: Callable[[], Awaitable[T | None]] | None = None) -> T:
+        """Return the result of `function()`, shared with the concurrent calls for `key`."""
+        while True:
+            future = self.calls.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # the leading call was cancelled (along with its request), so this call leads a new one
+                if not future.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())  # errors without followers are fine
+        self.calls[key] = future
+        self.leaders += 1
+        try:
+            result = await self.call(key, function, lookup)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.calls[key]
+
+    async def call(self, key: str, function: Callable[[], Awaitable[T]], lookup: Callable[[], Awaitable[T | None]] | None) -> T:
+        """Run `function()`, or wait for the worker holding the lock of `key` to fill the cache."""
+        if not self.distributed or lookup is None:
+            return await function()
+
+        lock_key = f'single_flight:{self.name}:{key}'
+        token = uuid4().hex
+        try:
+            acquired = await redis_client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+        except RedisError:
+            return await function()
+
+        if acquired:
+            try:
+                return await function()
+            finally:
+                try:
+                    await release_script(keys=[lock_key], args=[token])
+                except RedisError:
+                    pass
+
+        self.lock_waits += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl
+        try:
+            while loop.time() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                value = await lookup()
+                if value is not None:
+                    return value
+                # the holder is done without filling the cache (e.g. nothing was found), no use waiting
+                if not await redis_client.exists(lock_key):
+                    break
+            else:
+                self.lock_timeouts += 1
+        except RedisError:
+            pass
+        return await function()
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters of the coalescing."""
+        return {
+            'in_flight': len(self.calls),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'lock_waits': self.lock_waits,
+            'lock_timeouts': self.lock_timeouts,
+        }
+
+
+# coalesces the concurrent cache misses of the same listing, in `fetch_listing_by_id`
+listing_flight = SingleFlight(
+    'listings',
+    distributed=Config.SINGLE_FLIGHT_DISTRIBUTED,
+    lock_ttl=Config.SINGLE_FLIGHT_LOCK_TTL,
+    poll_interval=Config.SINGLE_FLIGHT_POLL_INTERVAL,
+)
@@ -0,0 +1,29 @@
+import time
+from contextlib import contextmanager
+
+from utils.metrics import startup_step_duration
+
+
+class StartupTimer:
+    """Records how long every step of the startup takes, so slow boots can be traced to a step."""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps: list[tuple[str, float]] = []
+
+    @contextmanager
+    def step(self, name: str):
+        """Time the block as the startup step `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.steps.append((name, elapsed))
+            startup_step_duration.labels(name).set(elapsed)
+
+    def report(self) -> str:
+        """Return the total startup time and the time of every step."""
+        total = time.perf_counter() - self.start
+        startup_step_duration.labels('total').set(total)
+        steps = ', '.join(f'{name} {elapsed * 1000:.1f}ms' for name, elapsed in self.steps)
+        return f'[STARTUP] ready in {total * 1000:.1f}ms ({steps})'
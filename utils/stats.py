@@ -0,0 +1,55 @@
+import asyncio
+
+from redis.exceptions import RedisError
+
+from caching import redis_client
+
+
+class StatsReconciler:
+    """
+    Background task recounting the listing statistics every `interval` seconds, fixing any
+    drift of the incrementally maintained counters; with several workers, only the one taking
+    the Redis lock of an interval runs it (every worker does while Redis is unreachable).
+    """
+    lock_key = 'listing_stats_reconciliation'
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.runs = 0
+        self.fixed_counters = 0
+
+    async def acquire(self, interval: int) -> bool:
+        """Take the reconciliation turn of the current interval."""
+        try:
+            return bool(await redis_client.set(self.lock_key, 1, nx=True, ex=max(1, interval - 1)))
+        except RedisError:
+            return True
+
+    async def run(self, reconcile, interval: int) -> None:
+        """Call the `reconcile` coroutine right away and then every `interval` seconds."""
+        while True:
+            if await self.acquire(interval):
+                try:
+                    fixed = await reconcile()
+                    self.runs += 1
+                    self.fixed_counters += fixed
+                    if fixed:
+                        print(f'[LISTING STATS] reconciliation fixed {fixed} drifted counters')
+                except Exception as error:
+                    print(f'[LISTING STATS] reconciliation failed: {error!r}')
+            await asyncio.sleep(interval)
+
+    def start(self, reconcile, interval: int) -> None:
+        """Start reconciling the statistics in the background."""
+        self.task = asyncio.create_task(self.run(reconcile, interval))
+
+    async def stop(self) -> None:
+        """Stop reconciling the statistics."""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+
+# the statistics reconciler of this worker
+stats_reconciler = StatsReconciler()
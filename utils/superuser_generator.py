@@ -1,18 +1,20 @@
 from datetime import datetime
 
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from config import Config
 
 from crud.user import insert_user
-from authentication.password_handler import hash_password
+from authentication.password_handler import async_hash_password
 
 
-async def create_superuser() -> None:
+async def create_superuser(db: AsyncSession) -> None:
     """Function for creating the superuser."""
     superuser = {
         'username': Config.SUPERUSER_USERNAME,
         'full_name': 'Arash Hajian nezhad',
         'email': Config.SUPERUSER_EMAIL,
-        'password': hash_password(Config.SUPERUSER_PASSWORD),
+        'password': await async_hash_password(Config.SUPERUSER_PASSWORD),
         'date_of_birth': datetime(1998, 11, 20),
         'gender': 'MALE',
         'is_superuser': True,
@@ -20,4 +22,4 @@ async def create_superuser() -> None:
         'updated_at': datetime.utcnow(),
     }
         
-    await insert_user(superuser)
+    await insert_user(db, superuser)
@@ -0,0 +1,36 @@
+import asyncio
+
+from utils.address_index import AddressIndex
+
+
+def test_rebuild_keeps_the_changes_made_while_it_runs():
+    index = AddressIndex()
+    index.build([('1', 'Baker Street 1'), ('2', 'Abbey Road 2')])
+
+    async def load():
+        # the listings are added and removed by this worker while the rows are loaded
+        index.add('3', 'Baker Street 3')
+        index.remove('2')
+        return [('1', 'Baker Street 1'), ('2', 'Abbey Road 2')]
+
+    asyncio.run(index.rebuild(load))
+
+    assert [match['id'] for match in index.search('baker', 10)] == ['1', '3']
+    assert index.search('abbey', 10) == []
+    assert index.changes is None
+
+
+def test_rebuild_failure_keeps_the_previous_index():
+    index = AddressIndex()
+    index.build([('1', 'Baker Street 1')])
+
+    async def load():
+        raise RuntimeError('the database is unreachable')
+
+    try:
+        asyncio.run(index.rebuild(load))
+    except RuntimeError:
+        pass
+
+    assert index.search('baker', 10) == [{'id': '1', 'address': 'Baker Street 1'}]
+    assert index.changes is None
@@ -0,0 +1,56 @@
+import asyncio
+from uuid import uuid4
+
+from caching import redis_pool
+from utils.cache import TieredCache
+
+
+def run(coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            # the pooled connections belong to this event loop
+            await redis_pool.disconnect()
+    return asyncio.run(main())
+
+
+def new_cache() -> TieredCache:
+    return TieredCache(f'test-{uuid4().hex}', maxsize=10, local_ttl=60, redis_ttl=60)
+
+
+def test_set_caches_a_value_loaded_at_the_current_generation():
+    cache = new_cache()
+
+    async def load_and_set():
+        generation = await cache.generation('listing')
+        await cache.set('listing', {'available_now': True}, generation)
+        return await cache.get('listing')
+
+    assert run(load_and_set()) == {'available_now': True}
+
+
+def test_set_drops_a_value_loaded_before_an_invalidation():
+    cache = new_cache()
+
+    async def load_invalidate_set():
+        # a reader loads the row, a writer commits and invalidates, then the reader caches the row it loaded
+        generation = await cache.generation('listing')
+        await cache.invalidate('listing')
+        await cache.set('listing', {'available_now': True}, generation)
+        return await cache.get('listing')
+
+    assert run(load_invalidate_set()) is None
+    assert cache.stats()['stale_sets'] == 1
+
+
+def test_set_drops_a_value_loaded_before_another_worker_invalidated_it():
+    cache = new_cache()
+
+    async def load_drop_set():
+        generation = await cache.generation('listing')
+        cache.drop_local(['listing'])
+        await cache.set('listing', {'available_now': True}, generation)
+        return cache.local.get('listing')
+
+    assert run(load_drop_set()) is None
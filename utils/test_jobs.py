@@ -0,0 +1,62 @@
+import asyncio
+
+from utils.jobs import Job, JobRegistry, MemoryJobStore
+
+
+def new_registry(calls: list[str]) -> JobRegistry:
+    registry = JobRegistry(MemoryJobStore(max_finished=10), concurrency=1, progress_interval=0.01)
+
+    async def count(job: Job, n: int) -> None:
+        calls.append(job.id)
+        job.progress['items'] = n
+
+    registry.register('count', count)
+    return registry
+
+
+def test_job_runs_and_records_its_progress():
+    calls = []
+    registry = new_registry(calls)
+
+    async def submit_and_run():
+        job = await registry.submit('count', 'owner', n=3)
+        await registry.run(await registry.store.load(job.id))
+        return job.id, await registry.get(job.id)
+
+    id, job = asyncio.run(submit_and_run())
+    assert calls == [id]
+    assert job.status == 'SUCCEEDED' and job.progress == {'items': 3}
+
+
+def test_job_cancelled_between_its_load_and_its_run_never_runs():
+    calls = []
+    registry = new_registry(calls)
+
+    async def load_cancel_run():
+        job = await registry.submit('count', 'owner', n=3)
+        # a worker loads the pending job, then the job is cancelled before the worker runs it
+        loaded = await registry.store.load(job.id)
+        await registry.cancel(job.id)
+        await registry.run(loaded)
+        return await registry.get(job.id)
+
+    job = asyncio.run(load_cancel_run())
+    assert calls == []
+    assert job.status == 'CANCELLED'
+
+
+def test_cancelling_a_job_started_meanwhile_does_not_mark_it_cancelled():
+    calls = []
+    registry = new_registry(calls)
+
+    async def start_then_cancel_stale():
+        job = await registry.submit('count', 'owner', n=3)
+        stale = await registry.store.load(job.id)
+        await registry.run(await registry.store.load(job.id))
+        # a cancellation based on the stale (pending) copy finds the job already finished
+        stale.status = 'CANCELLED'
+        assert not await registry.store.transition(stale, 'PENDING')
+        return await registry.cancel(job.id)
+
+    job = asyncio.run(start_then_cancel_stale())
+    assert job.status == 'SUCCEEDED'
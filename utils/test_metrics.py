@@ -0,0 +1,39 @@
+from fastapi import FastAPI, Request
+
+from utils.metrics import route_template
+
+
+app = FastAPI()
+
+
+@app.get('/api/v1/listings/{id}')
+async def get_listing(id: str) -> dict:
+    return {'id': id}
+
+
+def new_request(path: str) -> Request:
+    return Request({'type': 'http', 'method': 'GET', 'path': path, 'root_path': '', 'headers': [], 'app': app})
+
+
+def test_route_template_scans_the_routes_once_per_request(monkeypatch):
+    request, scans = new_request('/api/v1/listings/abc'), []
+    route = next(route for route in app.router.routes if route.path == '/api/v1/listings/{id}')
+    matches = route.matches
+    monkeypatch.setattr(route, 'matches', lambda scope: scans.append(scope) or matches(scope))
+
+    # the metrics and the query log middlewares both label the request, each through its own `Request`
+    assert route_template(request) == '/api/v1/listings/{id}'
+    assert route_template(Request(request.scope)) == '/api/v1/listings/{id}'
+    assert len(scans) == 1
+
+
+def test_route_template_of_an_unmatched_request():
+    request = new_request('/missing')
+    assert route_template(request) == '<unmatched>'
+    assert request.state.route_template == '<unmatched>'
+
+
+def test_route_template_uses_the_matched_route():
+    request = new_request('/api/v1/listings/abc')
+    request.scope['route'] = next(route for route in app.router.routes if route.path == '/api/v1/listings/{id}')
+    assert route_template(request) == '/api/v1/listings/{id}'
@@ -0,0 +1,68 @@
+import asyncio
+from uuid import uuid4
+
+from caching import redis_pool
+from utils import rate_limit
+from utils.rate_limit import RateLimitRule, LocalRateLimiter, check_rate_limit, match_rule
+
+
+def run(coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            # the pooled connections belong to this event loop
+            await redis_pool.disconnect()
+    return asyncio.run(main())
+
+
+def test_local_limiter_allows_a_burst_of_limit_requests():
+    limiter = LocalRateLimiter()
+    results = [limiter.check('key', interval=8572, period=8572 * 7) for _ in range(8)]
+
+    assert [result.allowed for result in results] == [True] * 7 + [False]
+    assert [result.remaining for result in results[:7]] == [6, 5, 4, 3, 2, 1, 0]
+    assert 0 < results[-1].retry_after <= 8.572
+
+
+def test_local_limiter_counts_keys_apart():
+    limiter = LocalRateLimiter()
+    assert limiter.check('first', interval=1000, period=1000).allowed
+    assert not limiter.check('first', interval=1000, period=1000).allowed
+    assert limiter.check('second', interval=1000, period=1000).allowed
+
+
+def test_check_rate_limit_passes_whole_milliseconds(monkeypatch):
+    calls = []
+
+    async def gcra_script(keys, args):
+        calls.append(args)
+        return [1, 6, 0]
+
+    monkeypatch.setattr(rate_limit, 'gcra_script', gcra_script)
+    result = asyncio.run(check_rate_limit('key', RateLimitRule(7, 60)))
+
+    assert result.allowed and result.remaining == 6
+    # a fractional `PX` is rejected by Redis, which used to fall back to the per-worker limiter on every request
+    assert calls == [[8572, 8572 * 7]]
+    assert all(isinstance(arg, int) for arg in calls[0])
+
+
+def test_check_rate_limit_enforces_a_limit_not_dividing_the_period():
+    key = f'rate_limit:test:{uuid4().hex}'
+
+    async def burst():
+        return [await check_rate_limit(key, RateLimitRule(7, 60)) for _ in range(8)]
+
+    results = run(burst())
+    assert [result.allowed for result in results] == [True] * 7 + [False]
+    assert results[-1].retry_after > 0
+
+
+def test_match_rule_picks_the_longest_prefix(monkeypatch):
+    user_rule, token_rule = RateLimitRule(300, 60, 'user'), RateLimitRule(5, 60)
+    monkeypatch.setattr(rate_limit, 'rules', [('/api/v1/auth/token/', token_rule), ('/api/v1', user_rule)])
+
+    assert match_rule('/api/v1/auth/token/') == ('/api/v1/auth/token/', token_rule)
+    assert match_rule('/api/v1/listings/getAllListings/') == ('/api/v1', user_rule)
+    assert match_rule('/metrics') is None